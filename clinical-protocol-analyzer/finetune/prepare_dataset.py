@@ -1,14 +1,164 @@
-import argparse, json, os, glob
+import argparse, json, os, glob, sys, hashlib
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROTOCOL_NAMES = ["protocol.pdf", "protocol.docx", "protocol.txt", "protocol.md"]
+
+def iter_runs(runs_dir):
+    # a run is any directory holding main.py's outputs: output/analysis_report.md (+ data/)
+    for root, dirs, files in os.walk(runs_dir):
+        if os.path.isfile(os.path.join(root, "output", "analysis_report.md")):
+            dirs[:] = []
+            yield root
+
+def _read(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+def _load_chunks(protocol_path, cfg):
+    from modules import parser as parser_mod
+    from modules.chunker import chunk_text
+    from modules.dedup import strip_page_boilerplate, dedup_chunks
+    from modules.tables import extract_pdf
+    dd = cfg.get("dedup", {})
+    tb = cfg.get("tables", {})
+    tables = []
+    if tb.get("enabled", True) and protocol_path.lower().endswith(".pdf"):
+        pages, tables = extract_pdf(protocol_path, strip=tb.get("strip_from_text", True), min_rows=tb.get("min_rows", 2), min_cols=tb.get("min_cols", 2))
+    else:
+        pages = parser_mod.load_pages(protocol_path)
+    if dd.get("strip_headers", True):
+        pages = strip_page_boilerplate(pages)
+    text = parser_mod.clean_text("\n".join(pages))
+    chunks = chunk_text(text, size=cfg["vector_store"]["chunk_size"], overlap=cfg["vector_store"]["chunk_overlap"])
+    if dd.get("enabled", True):
+        chunks, _ = dedup_chunks(chunks, threshold=dd.get("threshold", 0.85), num_perm=dd.get("num_perm", 64), shingle_size=dd.get("shingle_size", 5))
+    return chunks, tables
+
+def _load_digest(run, chunks):
+    from modules.digest import digest_path
+    path = digest_path(os.path.join(run, "data", "digest_cache"), chunks)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _find_protocol(run, manifest):
+    # manifest's recorded protocol first (main.py --protocol can point anywhere), then data/protocol.*
+    rec = (manifest or {}).get("protocol") or {}
+    if rec.get("path"):
+        path = rec["path"] if os.path.isabs(rec["path"]) else os.path.join(run, rec["path"])
+        if os.path.exists(path):
+            from modules.amendment import file_sha256
+            if rec.get("sha256") and file_sha256(path) != rec["sha256"]:
+                return None, f"protocol {path} changed since the run"
+            return path, None
+    data_dir = os.path.join(run, "data")
+    path = next((os.path.join(data_dir, n) for n in PROTOCOL_NAMES if os.path.exists(os.path.join(data_dir, n))), None)
+    if path:
+        return path, None
+    return None, f"protocol not found ({rec.get('path') or 'no path in run manifest'})"
+
+def build_run_records(job):
+    """
+    Worker: rebuild each section's prompt for one past run and pair it with the section it produced.
+    A rebuilt prompt is used only if its evidence fingerprint matches the one the run recorded,
+    so config drift or a low-memory run (different chunking) never pairs a completion with a
+    prompt that did not produce it. Returns (run, records, skip_reason, n_mismatched).
+    """
+    run, cfg = job
+    from modules.advanced_analyzer import SECTIONS, build_section_prompt
+    from modules.report_generator import split_sections
+    from modules.ctgov import load_studies
+    from modules.amendment import load_manifest, chunk_hashes, evidence_fingerprint
+    data_dir = os.path.join(run, "data")
+    manifest = load_manifest(os.path.join(data_dir, "run_manifest.json"))
+    if not manifest or not manifest.get("sections"):
+        return run, [], "no data/run_manifest.json with section fingerprints", 0
+    protocol, reason = _find_protocol(run, manifest)
+    if not protocol:
+        return run, [], reason, 0
+    mcp_path = os.path.join(data_dir, "mcp_output.txt")
+    ct_path = next((p for p in (os.path.join(data_dir, f"ctgov_matches.{e}") for e in ["parquet", "jsonl"]) if os.path.exists(p)), None)
+    if not os.path.exists(mcp_path) or not ct_path:
+        return run, [], "missing data/mcp_output.txt or data/ctgov_matches.*", 0
+    try:
+        chunks, tables = _load_chunks(protocol, cfg)
+    except Exception as e:
+        return run, [], str(e), 0
+    mcp_blob = _read(mcp_path)
+    ctgov_items = load_studies(ct_path)
+    digest = _load_digest(run, chunks)
+    sections = split_sections(_read(os.path.join(run, "output", "analysis_report.md")))
+    recorded = manifest["sections"]
+    hashes = chunk_hashes(chunks)
+    records, n_mismatched = [], 0
+    for sec in SECTIONS:
+        completion = sections.get(sec["title"], "")
+        rec = recorded.get(sec["title"], {})
+        # sections cut off by their generation deadline are not training targets
+        if not completion or rec.get("partial") or "_[Partial:" in completion:
+            continue
+        prompt = build_section_prompt(sec, chunks, mcp_blob, ctgov_items, digest, tables)
+        if rec.get("fingerprint") != evidence_fingerprint(prompt, hashes):
+            n_mismatched += 1
+            continue
+        records.append({"section": sec["title"], "prompt": prompt, "completion": completion})
+    return run, records, None, n_mismatched
+
+def build_from_runs(runs_dir, out_dir, config_path, workers, shards):
+    import yaml
+    cfg = yaml.safe_load(open(config_path, "r", encoding="utf-8"))
+    os.makedirs(out_dir, exist_ok=True)
+    outs = [open(os.path.join(out_dir, f"shard-{i:03d}.jsonl"), "w", encoding="utf-8") for i in range(shards)]
+    seen = set()  # 16-byte content digests only; records themselves are never retained
+    n_runs = n_written = n_dupes = n_skipped = n_mismatched = 0
+    try:
+        with Pool(processes=workers) as pool:
+            jobs = ((run, cfg) for run in iter_runs(runs_dir))
+            for run, records, reason, mismatched in pool.imap_unordered(build_run_records, jobs, chunksize=1):
+                n_runs += 1
+                if reason:
+                    n_skipped += 1
+                    print(f"Skipping {run}: {reason}", file=sys.stderr)
+                if mismatched:
+                    n_mismatched += mismatched
+                    print(f"{run}: {mismatched} sections skipped, rebuilt prompt does not match the run's fingerprint", file=sys.stderr)
+                for r in records:
+                    h = hashlib.sha256((r["prompt"] + "\0" + r["completion"]).encode("utf-8")).digest()[:16]
+                    if h in seen:
+                        n_dupes += 1
+                        continue
+                    seen.add(h)
+                    outs[h[0] % shards].write(json.dumps({**r, "run": os.path.relpath(run, runs_dir)}) + "\n")
+                    n_written += 1
+    finally:
+        for f in outs:
+            f.close()
+    print(f"Scanned {n_runs} runs ({n_skipped} skipped): wrote {n_written} records ({n_dupes} duplicates dropped, "
+          f"{n_mismatched} sections with mismatched prompts skipped) to {shards} shards in {out_dir}")
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--protocol_dir", required=True)
-    ap.add_argument("--mcp_file", required=True)
-    ap.add_argument("--ctgov_file", required=True)
-    ap.add_argument("--report_file", required=True)
-    ap.add_argument("--out", required=True)
+    ap.add_argument("--runs_dir", help="Directory of past runs (each with data/ and output/ from main.py); enables per-section streaming mode")
+    ap.add_argument("--config", default="config.yaml", help="Pipeline config used for chunking/dedup in --runs_dir mode")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    ap.add_argument("--shards", type=int, default=None, help="Output shard count in --runs_dir mode (default: --workers)")
+    ap.add_argument("--protocol_dir")
+    ap.add_argument("--mcp_file")
+    ap.add_argument("--ctgov_file")
+    ap.add_argument("--report_file")
+    ap.add_argument("--out", required=True, help="Output JSONL file, or output directory in --runs_dir mode")
     args = ap.parse_args()
 
+    if args.runs_dir:
+        build_from_runs(args.runs_dir, args.out, args.config, args.workers, args.shards or args.workers)
+        return
+    missing = [a for a in ["protocol_dir", "mcp_file", "ctgov_file", "report_file"] if not getattr(args, a)]
+    if missing:
+        ap.error("single-run mode requires: " + ", ".join("--" + m for m in missing))
+
     # Collect protocol texts (if any .txt/.md are available post-OCR or manual export)
     protos = []
     for p in glob.glob(os.path.join(args.protocol_dir, "*.txt")) + glob.glob(os.path.join(args.protocol_dir, "*.md")):
@@ -16,7 +166,8 @@ def main():
             protos.append(f.read())
 
     mcp_blob = open(args.mcp_file, "r", encoding="utf-8", errors="ignore").read()
-    ctgov_items = [json.loads(line) for line in open(args.ctgov_file, "r", encoding="utf-8", errors="ignore") if line.strip()]
+    from modules.ctgov import load_studies, frame_to_items
+    ctgov_items = frame_to_items(load_studies(args.ctgov_file))
     report = open(args.report_file, "r", encoding="utf-8", errors="ignore").read()
 
     # Summarize CTGov
@@ -1,10 +1,152 @@
-import argparse, yaml, os
-from datasets import load_dataset
-from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer, DataCollatorForLanguageModeling
+import argparse, yaml, os, json, hashlib, glob
+import torch
+from datasets import load_dataset, load_from_disk
+from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer
 from peft import LoraConfig, get_peft_model
 
+ANSWER_SEP = "\n\n### Answer\n"
+PREP_VERSION = 2  # bump when tokenization/packing logic changes to invalidate caches
+
 def format_example(ex):
-    return ex["prompt"] + "\n\n### Answer\n" + ex["completion"]
+    return ex["prompt"] + ANSWER_SEP + ex["completion"]
+
+def _file_sig(path):
+    # dataset_path may be a single JSONL or a glob over shards from prepare_dataset --runs_dir
+    sigs = []
+    for p in sorted(glob.glob(path)) or [path]:
+        st = os.stat(p)
+        sigs.append(f"{os.path.abspath(p)}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(sigs)
+
+def dataset_cache_key(cfg):
+    data = cfg.get("data", {})
+    key = {
+        "v": PREP_VERSION,
+        "model": cfg["model_name"],
+        "dataset": _file_sig(cfg["dataset_path"]),
+        "max_seq_len": cfg["train"]["max_seq_len"],
+        "pack": data.get("pack", True),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def tokenize_batch(batch, tokenizer, max_len):
+    # prompt tokens get label -100 so loss is only taken on the completion
+    prompts = [p + ANSWER_SEP for p in batch["prompt"]]
+    p_ids = tokenizer(prompts, add_special_tokens=True)["input_ids"]
+    c_ids = tokenizer(batch["completion"], add_special_tokens=False)["input_ids"]
+    eos = [tokenizer.eos_token_id] if tokenizer.eos_token_id is not None else []
+    bos = [tokenizer.bos_token_id] if tokenizer.bos_token_id is not None else []
+    out = {"input_ids": [], "labels": []}
+    for p, c in zip(p_ids, c_ids):
+        c = c + eos
+        if not c:
+            continue
+        # section prompts run to several thousand tokens: keep the completion (up to half the
+        # window) and drop prompt tokens from the front, keeping BOS and the answer separator
+        room = max_len - min(len(c), max_len // 2)
+        if len(p) > room:
+            lead = bos if bos and p[:1] == bos else []
+            p = lead + p[len(p) - (room - len(lead)):]
+        ids = (p + c)[:max_len]
+        labels = ([-100] * len(p) + c)[:max_len]
+        out["input_ids"].append(ids)
+        out["labels"].append(labels)
+    return out
+
+def pack_batch(batch, max_len):
+    """
+    Greedily concatenate examples into max_len sequences. position_ids restart at 0 for
+    every example; the collator turns those restarts into a block-diagonal attention mask.
+    """
+    out = {"input_ids": [], "labels": [], "position_ids": []}
+    cur_ids, cur_labels, cur_pos = [], [], []
+    for ids, labels in zip(batch["input_ids"], batch["labels"]):
+        if cur_ids and len(cur_ids) + len(ids) > max_len:
+            out["input_ids"].append(cur_ids); out["labels"].append(cur_labels); out["position_ids"].append(cur_pos)
+            cur_ids, cur_labels, cur_pos = [], [], []
+        cur_ids += ids
+        cur_labels += labels
+        cur_pos += list(range(len(ids)))
+    if cur_ids:
+        out["input_ids"].append(cur_ids); out["labels"].append(cur_labels); out["position_ids"].append(cur_pos)
+    return out
+
+class PackedCollator:
+    """
+    Pads to the longest sequence in the batch. With position_ids present, builds an additive
+    4D mask (B,1,L,L) that is causal within each packed example and blocks attention across
+    example boundaries and padding (needs transformers>=4.42 to pass custom 4D masks through).
+    """
+    def __init__(self, pad_id):
+        self.pad_id = pad_id
+
+    def __call__(self, features):
+        L = max(len(f["input_ids"]) for f in features)
+        B = len(features)
+        input_ids = torch.full((B, L), self.pad_id, dtype=torch.long)
+        labels = torch.full((B, L), -100, dtype=torch.long)
+        valid = torch.zeros((B, L), dtype=torch.bool)
+        packed = "position_ids" in features[0]
+        pos = torch.zeros((B, L), dtype=torch.long)
+        for i, f in enumerate(features):
+            n = len(f["input_ids"])
+            input_ids[i, :n] = torch.tensor(f["input_ids"])
+            labels[i, :n] = torch.tensor(f["labels"])
+            valid[i, :n] = True
+            pos[i, :n] = torch.tensor(f["position_ids"]) if packed else torch.arange(n)
+        batch = {"input_ids": input_ids, "labels": labels, "position_ids": pos}
+        if not packed:
+            batch["attention_mask"] = valid.long()
+            return batch
+        seg = torch.cumsum((pos == 0).long(), dim=1)  # example index within each row
+        same = seg[:, :, None] == seg[:, None, :]
+        causal = torch.tril(torch.ones((L, L), dtype=torch.bool))
+        allowed = same & causal[None] & valid[:, None, :] & valid[:, :, None]
+        allowed |= torch.eye(L, dtype=torch.bool)[None]  # keep padded rows finite
+        mask = torch.zeros((B, 1, L, L), dtype=torch.float32)
+        mask.masked_fill_(~allowed[:, None], torch.finfo(torch.float32).min)
+        batch["attention_mask"] = mask
+        return batch
+
+def build_train_dataset(cfg, tokenizer):
+    data = cfg.get("data", {})
+    max_len = cfg["train"]["max_seq_len"]
+    num_proc = data.get("num_proc") or max(1, (os.cpu_count() or 2) - 1)
+    cache_dir = data.get("cache_dir", "finetune/cache")
+    path = os.path.join(cache_dir, dataset_cache_key(cfg))
+    if os.path.isdir(path):
+        print("Loading tokenized dataset from cache:", path)
+        return load_from_disk(path)
+
+    ds = load_dataset("json", data_files=cfg["dataset_path"], split="train")
+    n_raw = len(ds)
+    num_proc = min(num_proc, max(1, len(ds) // 64))  # process pools don't pay off on tiny sets
+    ds = ds.map(
+        tokenize_batch,
+        fn_kwargs={"tokenizer": tokenizer, "max_len": max_len},
+        batched=True,
+        batch_size=256,
+        num_proc=num_proc,
+        remove_columns=ds.column_names,
+        desc="Tokenizing",
+    )
+    dropped = n_raw - len(ds)
+    if dropped:
+        print(f"Dropped {dropped}/{n_raw} examples with an empty completion")
+    if len(ds) == 0:
+        raise ValueError(f"No trainable examples in {cfg['dataset_path']} after tokenization")
+    if data.get("pack", True):
+        ds = ds.map(
+            pack_batch,
+            fn_kwargs={"max_len": max_len},
+            batched=True,
+            batch_size=1000,
+            num_proc=num_proc,
+            remove_columns=ds.column_names,
+            desc="Packing",
+        )
+    ds.save_to_disk(path)
+    return ds
 
 def main():
     ap = argparse.ArgumentParser()
@@ -13,11 +155,15 @@ def main():
     cfg = yaml.safe_load(open(args.config, "r", encoding="utf-8"))
 
     model_name = cfg["model_name"]
-    dataset_path = cfg["dataset_path"]
     out_dir = cfg["output_dir"]
     os.makedirs(out_dir, exist_ok=True)
 
     tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    if tokenizer.pad_token_id is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    ds = build_train_dataset(cfg, tokenizer)
+    print(f"Training sequences: {len(ds)}")
+
     model = AutoModelForCausalLM.from_pretrained(model_name)
 
     # LoRA
@@ -32,16 +178,7 @@ def main():
     )
     model = get_peft_model(model, lora_cfg)
 
-    ds = load_dataset("json", data_files=dataset_path, split="train")
-
-    def preprocess(example):
-        text = format_example(example)
-        enc = tokenizer(text, truncation=True, padding="max_length", max_length=cfg["train"]["max_seq_len"])
-        enc["labels"] = enc["input_ids"].copy()
-        return enc
-
-    ds = ds.map(preprocess, batched=False)
-    collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+    collator = PackedCollator(pad_id=tokenizer.pad_token_id)
 
     training_args = TrainingArguments(
         output_dir=out_dir,
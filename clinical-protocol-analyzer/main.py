@@ -1,18 +1,25 @@
 import argparse
 import yaml
-import json
 import os
 from modules.logger import get_logger
 from modules import parser as parser_mod
-from modules.chunker import chunk_text
+from modules.chunker import chunk_text, iter_chunks
+from modules.dedup import strip_page_boilerplate, dedup_chunks, boilerplate_lines, strip_boilerplate_page
+from modules.tables import extract_pdf, iter_pdf, save_tables, table_tsv
+from modules.memory import MemoryMonitor
+from modules.digest import build_digest, render_digest
 from modules.retriever import Retriever
-from modules.llm import build_llm
+from modules.llm import build_llm, BoundedLLM
 from modules.extractor import extract_trial_entities
 from modules.mcp_runner import build_query_variants, generate_mcp_commands, run_mcp_auto
-from modules.ctgov import query_studies_variants, simplify_ctgov
+from modules.ctgov import iter_studies_variants, parse_studies, studies_frame, dedup_studies, filter_studies, save_studies, load_studies
 # Replaced old analyzer import:
-from modules.advanced_analyzer import SECTIONS
-from modules.report_generator import to_markdown, md_to_pdf
+from modules.advanced_analyzer import SECTIONS, build_section_prompt, section_budget
+from modules.report_generator import to_markdown, PdfReportWriter, split_sections
+from modules.amendment import SectionTracker, chunk_hashes, diff_chunks, load_manifest, save_manifest, protocol_record
+
+MANIFEST_PATH = "data/run_manifest.json"
+TABLES_PATH = "data/tables.json"
 
 
 def ensure_dirs():
@@ -20,107 +27,302 @@ def ensure_dirs():
         os.makedirs(d, exist_ok=True)
 
 
-def run_advanced_analysis(llm, protocol_chunks, mcp_blob, ctgov_items, k):
+def stream_chunks(path, cfg, mem, window=16):
+    """
+    Low-memory load: pages are streamed through boilerplate stripping, cleaning and chunking,
+    so the raw, joined and cleaned full texts are never held. Header/footer detection takes a
+    first pass over plain page text; tables are extracted on the second pass.
+    """
+    dd = cfg.get("dedup", {})
+    tb = cfg.get("tables", {})
+    boiler = boilerplate_lines(parser_mod.iter_pages(path)) if dd.get("strip_headers", True) else set()
+    tables = []
+    if tb.get("enabled", True) and path.lower().endswith(".pdf"):
+        pages = iter_pdf(path, tables, strip=tb.get("strip_from_text", True), min_rows=tb.get("min_rows", 2), min_cols=tb.get("min_cols", 2))
+    else:
+        pages = parser_mod.iter_pages(path)
+    pages = (strip_boilerplate_page(p, boiler) for p in pages)
+    chunks = []
+    for c in iter_chunks(parser_mod.iter_clean(pages), size=cfg["vector_store"]["chunk_size"], overlap=cfg["vector_store"]["chunk_overlap"], window=window):
+        chunks.append(c)
+        if c["id"] % 256 == 0:
+            mem.check()
+    return chunks, tables
+
+
+def run_advanced_analysis(llm, protocol_chunks, mcp_blob, ctgov_items, k, digest="", on_section=None, tracker=None, log=None, tables=None,
+                          prompt_window=None):
     narrative_sections = []
+    partial = []
+    done = {}  # title -> (output, cut) for reused sections and concurrently generated ones
+    concurrent = hasattr(llm, "generate_many")  # async backends keep several sections in flight
+
+    def prompt_for(section):
+        return build_section_prompt(section, protocol_chunks, mcp_blob, ctgov_items, digest, tables)
+
+    def reuse(section, prompt):
+        # amendment check + manifest record; the caller drops the prompt unless it generates from it
+        output = tracker.reuse(section["title"], prompt)
+        tracker.record(section["title"], prompt)
+        return output
+
+    if concurrent:
+        # prompts are kept only when generate_many will consume them; with prompt_window
+        # (low-memory mode) they are rebuilt per wave so at most one wave exists at a time
+        pending = []
+        for section in SECTIONS:
+            prompt = prompt_for(section) if tracker or not prompt_window else None
+            output = reuse(section, prompt) if tracker else None
+            if output is not None:
+                done[section["title"]] = (output, None)
+                continue
+            pending.append((section, None if prompt_window else prompt))
+            del prompt
+        step = prompt_window or len(pending) or 1
+        for w in range(0, len(pending), step):
+            wave = [(section, prompt or prompt_for(section)) for section, prompt in pending[w:w + step]]
+            results = llm.generate_many([(prompt, section_budget(llm, section)) for section, prompt in wave])
+            done.update({section["title"]: r for (section, _), r in zip(wave, results)})
+            del wave
+
     for section in SECTIONS:
         title = section["title"]
-        fn = section["fn"]
         narrative_sections.append(f"# {title}\n")
-        output = fn(llm, protocol_chunks, mcp_blob, ctgov_items)
+        if title in done:
+            output, cut = done.pop(title)
+        else:
+            # sequential backends: one prompt at a time, built once and dropped after generation
+            prompt = prompt_for(section) if tracker else None
+            output = reuse(section, prompt) if tracker else None
+            cut = None
+            if output is None:
+                bounded = BoundedLLM(llm, section_budget(llm, section))
+                if prompt is not None:
+                    output = bounded.generate(prompt)
+                else:
+                    output = section["fn"](bounded, protocol_chunks, mcp_blob, ctgov_items, digest, tables)
+                cut = bounded.cut
+            del prompt
+        if cut == "deadline":
+            partial.append(title)
+            output = output.rstrip() + "\n\n_[Partial: this section hit its generation deadline]_"
+            if tracker:
+                tracker.mark_partial(title)
+            if log:
+                log.warning(f"Section '{title}' hit its {section_budget(llm, section).get('deadline_s')}s deadline; kept partial output")
         narrative_sections.append(output)
         narrative_sections.append("\n\n")
+        if on_section:
+            on_section(title, output)
+    if partial and log:
+        log.info(f"{len(partial)}/{len(SECTIONS)} sections are partial: {', '.join(partial)}")
     return "\n".join(narrative_sections)
 
-
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--protocol", required=True, help="Path to protocol PDF/DOCX/TXT")
     ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--amend", action="store_true", help="Amendment mode: only regenerate sections whose evidence changed since the prior run")
+    ap.add_argument("--prior_dir", default=".", help="Directory of the prior run (holding data/run_manifest.json and the report)")
+    ap.add_argument("--refresh_external", action="store_true", help="In amendment mode, re-run entity extraction, BiMCP and CTGov instead of reusing the prior run's")
     args = ap.parse_args()
 
     ensure_dirs()
     cfg = yaml.safe_load(open(args.config, "r", encoding="utf-8"))
-    log = get_logger(cfg["runtime"]["log_path"])
+    lg = cfg["runtime"].get("logging", {})
+    log = get_logger(
+        cfg["runtime"]["log_path"],
+        queued=lg.get("queued", False),
+        json_lines=lg.get("json", False),
+        level=lg.get("level", "INFO"),
+        debug_sample_rate=lg.get("debug_sample_rate", 1.0),
+    )
+
+    lm = cfg["runtime"].get("low_memory", {})
+    low_mem = lm.get("enabled", False)
+    mem = MemoryMonitor(ceiling_mb=lm.get("rss_ceiling_mb") if low_mem else None, hard=lm.get("hard_ceiling", False), log=log)
 
     # 1) Load protocol
     log.info(f"Loading protocol: {args.protocol}")
-    raw = parser_mod.load_text(args.protocol)
-    text = parser_mod.clean_text(raw)
-    log.info(f"Protocol length: {len(text):,} chars")
-
-    # 2) Chunk & index
+    mem.begin("load+chunk")
+    dd = cfg.get("dedup", {})
+    tb = cfg.get("tables", {})
     size = cfg["vector_store"]["chunk_size"]
     overlap = cfg["vector_store"]["chunk_overlap"]
-    chunks = chunk_text(text, size=size, overlap=overlap)
+    tables = []
+    if low_mem:
+        chunks, tables = stream_chunks(args.protocol, cfg, mem, window=lm.get("chunk_window", 16))
+    else:
+        if tb.get("enabled", True) and args.protocol.lower().endswith(".pdf"):
+            # schedule-of-assessments / lab / eligibility tables come out as rows+columns, indexed separately
+            pages, tables = extract_pdf(args.protocol, strip=tb.get("strip_from_text", True), min_rows=tb.get("min_rows", 2), min_cols=tb.get("min_cols", 2))
+        else:
+            pages = parser_mod.load_pages(args.protocol)
+        if dd.get("strip_headers", True):
+            pages = strip_page_boilerplate(pages)
+        raw = "\n".join(pages)
+        text = parser_mod.clean_text(raw)
+        log.info(f"Protocol length: {len(text):,} chars")
+        # 2) Chunk
+        chunks = chunk_text(text, size=size, overlap=overlap)
+        del pages, raw, text
+    if tables:
+        save_tables(TABLES_PATH, tables)
+        tsv_chars = sum(len(table_tsv(t)) for t in tables)
+        flat_chars = sum(t["flat_chars"] for t in tables)
+        kinds = ", ".join(f"{k}={sum(t['kind'] == k for t in tables)}" for k in sorted({t["kind"] for t in tables}))
+        log.info(f"Tables: {len(tables)} extracted ({kinds}); {tsv_chars:,} chars as TSV vs {flat_chars:,} flattened")
     log.info(f"Chunks: {len(chunks)}")
-    Retriever.build(
+
+    # 2) Dedup & index
+    mem.begin("dedup+embed")
+    if dd.get("enabled", True):
+        chunks, chunk_map = dedup_chunks(
+            chunks,
+            threshold=dd.get("threshold", 0.85),
+            num_perm=dd.get("num_perm", 64),
+            shingle_size=dd.get("shingle_size", 5),
+        )
+        log.info(f"Chunks after dedup: {len(chunks)} ({len(chunk_map) - len(chunks)} near-duplicates collapsed)")
+        del chunk_map
+    retriever = Retriever.build(
         chunks,
         index_path=cfg["vector_store"]["path"],
         emb_model=cfg["embeddings"]["model"],
         batch_size=cfg["embeddings"]["batch_size"],
         device=cfg["embeddings"]["device"],
+        token_budget=cfg["embeddings"].get("token_budget"),
+        workers=cfg["embeddings"].get("workers", 1),
+        quantization=cfg["vector_store"].get("quantization", "none"),
+        rescore_factor=cfg["vector_store"].get("rescore_factor", 4),
+        spill=low_mem,
     )
+    log.info("Embedded chunks", extra={"fields": retriever.index.stats})
+    if cfg["vector_store"].get("quantization_report", False):
+        for row in retriever.index.quantization_report():
+            log.info("Quantization recall vs memory", extra={"fields": row})
+    if low_mem:
+        del retriever  # index is persisted under vector_store.path; frees the embedding model
 
     # 3) LLM
+    mem.begin("entities+external")
     llm = build_llm(cfg)
 
-    # 4) Extract entities (with cleaned terms)
-    entities = extract_trial_entities(llm, chunks, strict=cfg["runtime"]["strict_grounding"])
-    log.info(f"Entities: {entities}")
-
-    # 5) MCP variant search
-    pairs, canon_pair_key = build_query_variants(entities)
-    cmds = generate_mcp_commands(
-        template=cfg["mcp"]["command_template"],
-        pairs=pairs,
-        limit=max(5, cfg["mcp"]["variants"]),
-    )
-    mcp_blob, mcp_mode_used = run_mcp_auto(
-        cmds,
-        canonical_cond=entities.get("condition_clean", entities.get("condition", "")),
-        canonical_intr=entities.get("intervention_clean", entities.get("intervention", "")),
-        prefer=cfg["mcp"].get("prefer", "cli"),
-    )
-    with open("data/mcp_output.txt", "w", encoding="utf-8") as f:
-        f.write(mcp_blob)
-
-    # 6) CTGov variant search
-    ct_json_blobs = query_studies_variants(
-        entities,
-        limit=cfg["ctgov"]["max_records"],
-        timeout=cfg["ctgov"]["timeout"],
-        max_pairs=6,
+    # Amendment mode: diff against the prior run at chunk-hash level
+    hashes = chunk_hashes(chunks)
+    prior, prior_sections = None, {}
+    if args.amend:
+        prior = load_manifest(os.path.join(args.prior_dir, MANIFEST_PATH))
+        prior_md = os.path.join(args.prior_dir, cfg["reporting"]["output_markdown"])
+        if prior and os.path.exists(prior_md):
+            with open(prior_md, "r", encoding="utf-8") as f:
+                prior_sections = split_sections(f.read())
+            log.info("Amendment diff", extra={"fields": diff_chunks(prior["chunks"], hashes)})
+        else:
+            log.info("Amendment mode: no prior manifest/report found; running full analysis")
+            prior = None
+    ct_path = f"data/ctgov_matches.{cfg['ctgov'].get('storage', 'parquet')}"
+    prior_ct = next((os.path.join(args.prior_dir, f"data/ctgov_matches.{ext}") for ext in ["parquet", "jsonl"]
+                     if os.path.exists(os.path.join(args.prior_dir, f"data/ctgov_matches.{ext}"))), None)
+    reuse_external = (
+        prior is not None and not args.refresh_external and prior.get("entities")
+        and os.path.exists(os.path.join(args.prior_dir, "data/mcp_output.txt"))
+        and prior_ct is not None
     )
-    ct_items = []
-    for blob in ct_json_blobs:
-        ct_items.extend(simplify_ctgov(blob))
-    # dedupe by NCT
-    seen = set()
-    dedup = []
-    for it in ct_items:
-        nct = it.get("nctId")
-        if nct and nct not in seen:
-            dedup.append(it)
-            seen.add(nct)
-    ct_items = dedup
-    with open("data/ctgov_matches.jsonl", "w", encoding="utf-8") as f:
-        for it in ct_items:
-            f.write(json.dumps(it) + "\n")
-
-    # 7) CRO narrative analysis (Markdown) using advanced_analyzer
+
+    if reuse_external:
+        # 4-6) Reuse the prior run's entities, BiMCP and CTGov results
+        entities = prior["entities"]
+        with open(os.path.join(args.prior_dir, "data/mcp_output.txt"), "r", encoding="utf-8") as f:
+            mcp_blob = f.read()
+        ct_df = load_studies(prior_ct)
+        with open("data/mcp_output.txt", "w", encoding="utf-8") as f:
+            f.write(mcp_blob)
+        save_studies(ct_df, ct_path)
+        log.info("Amendment mode: reusing prior entities, BiMCP and CTGov results")
+    else:
+        # 4) Extract entities (with cleaned terms)
+        entities = extract_trial_entities(llm, chunks, strict=cfg["runtime"]["strict_grounding"])
+        log.info("Entities extracted", extra={"fields": {"entities": entities}})
+
+        # 5) MCP variant search
+        pairs, canon_pair_key = build_query_variants(entities)
+        cmds = generate_mcp_commands(
+            template=cfg["mcp"]["command_template"],
+            pairs=pairs,
+            limit=max(5, cfg["mcp"]["variants"]),
+        )
+        mcp_blob, mcp_mode_used = run_mcp_auto(
+            cmds,
+            canonical_cond=entities.get("condition_clean", entities.get("condition", "")),
+            canonical_intr=entities.get("intervention_clean", entities.get("intervention", "")),
+            prefer=cfg["mcp"].get("prefer", "cli"),
+        )
+        with open("data/mcp_output.txt", "w", encoding="utf-8") as f:
+            f.write(mcp_blob)
+
+        # 6) CTGov variant search
+        ct_json_blobs = iter_studies_variants(
+            entities,
+            limit=cfg["ctgov"]["max_records"],
+            timeout=cfg["ctgov"]["timeout"],
+            max_pairs=6,
+        )
+        # blobs are fetched, parsed and dropped one at a time
+        ct_df = studies_frame(st for blob in ct_json_blobs for st in parse_studies(blob))
+        # dedupe by NCT, then optional precedent filters (vectorized)
+        ct_df = dedup_studies(ct_df)
+        ct_df = filter_studies(ct_df, **cfg["ctgov"].get("filter", {}))
+        save_studies(ct_df, ct_path)
+        log.info(f"CTGov precedents: {len(ct_df)}")
+
+    # 7) One-time protocol digest (map-reduce, cached by protocol hash)
+    mem.begin("digest")
+    digest = {}
+    dg = cfg.get("digest", {})
+    if dg.get("enabled", False):
+        digest = build_digest(
+            llm,
+            chunks,
+            cache_dir=dg.get("cache_dir", "data/digest_cache"),
+            workers=dg.get("workers", 4),
+            max_per_field=dg.get("max_per_field", 25),
+            log=log,
+            min_hits=dg.get("min_hits", 3),
+        )
+        log.info(f"Digest: {len(render_digest(digest)):,} chars (each section gets only its fields)")
+
+    # 8) CRO narrative analysis (Markdown) using advanced_analyzer; PDF pages are
+    #    rendered as each section finishes
+    mem.begin("sections")
+    pdf = PdfReportWriter(cfg["reporting"]["output_pdf"])
+    tracker = SectionTracker(hashes, prior, prior_sections)
     narrative = run_advanced_analysis(
         llm=llm,
         protocol_chunks=chunks,
         mcp_blob=mcp_blob,
-        ctgov_items=ct_items,
+        ctgov_items=ct_df,
         k=cfg["runtime"]["max_retrieved_chunks"],
+        digest=digest,
+        on_section=pdf.add_section,
+        tracker=tracker,
+        log=log,
+        tables=tables,
+        prompt_window=getattr(llm, "max_concurrency", None) if low_mem else None,
     )
+    pdf.close()
+    if hasattr(llm, "close"):
+        llm.close()
+    if tracker.reused:
+        log.info(f"Amendment mode: reused {len(tracker.reused)}/{len(SECTIONS)} sections from the prior report")
+    save_manifest(MANIFEST_PATH, hashes, tracker.sections, entities=entities, protocol=protocol_record(args.protocol))
 
-    # 8) Write report + print to terminal
+    # 9) Write report + print to terminal
+    mem.begin("report")
     md = to_markdown(narrative)
     with open(cfg["reporting"]["output_markdown"], "w", encoding="utf-8") as f:
         f.write(md)
-    md_to_pdf(md, cfg["reporting"]["output_pdf"])
+    mem.close()
 
     # --- PRINT TO TERMINAL (as requested) ---
     print("\n" + "=" * 80)
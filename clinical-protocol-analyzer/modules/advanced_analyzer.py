@@ -1,7 +1,9 @@
 # modules/advanced_analyzer.py
 from __future__ import annotations
-from typing import List, Dict, Any, Callable
-from .llm import LLMBase
+from typing import List, Dict, Any, Callable, Sequence, Union
+from .llm import LLMBase, DEFAULT_BUDGET
+from .precedents import render_precedents
+from .tables import select_tables
 import re
 
 def _fallback_generate(llm: LLMBase, prompt: str) -> str:
@@ -10,33 +12,91 @@ def _fallback_generate(llm: LLMBase, prompt: str) -> str:
     if hasattr(llm, "ask"): return llm.ask(prompt)
     raise AttributeError(f"LLM {type(llm).__name__} missing generate/chat/ask")
 
-def _ctx(protocol_chunks: List[dict], k: int) -> List[str]:
+class PromptRecorder(LLMBase):
+    """Stand-in LLM that echoes its prompt, so section prompts can be rebuilt without generating."""
+    def generate(self, prompt: str) -> str:
+        return prompt
+
+def section_budget(llm: LLMBase, section: Dict[str, Any]) -> Dict[str, Any]:
+    # backend default budget (config llm.default_budget) <- per-section overrides from SECTIONS
+    return {**DEFAULT_BUDGET, **getattr(llm, "budget", {}), **section.get("budget", {})}
+
+def build_section_prompt(section: Dict[str, Any], prot: List[dict], mcp_blob: str, ctlist, digest: Union[str, Dict[str, List[str]]] = "", tables=None) -> str:
+    return section["fn"](PromptRecorder(), prot, mcp_blob, ctlist, digest, tables)
+
+def _ctx(protocol_chunks: List[dict], k: int, digest=None, focus: str = "", n_targeted: int = 2, tables=None,
+         fields: Sequence[str] = ()) -> List[dict]:
+    # extracted tables relevant to this section's ask go in as TSV sources (Source[T<n>])
+    # with a protocol digest: only the digest fields this section uses, its best table and a
+    # couple of short excerpts targeted at its ask (a pre-rendered digest string is passed whole)
+    if digest:
+        table_ctx = select_tables(tables or [], focus, n=1, max_chars=3000)
+        if isinstance(digest, dict):
+            from .digest import render_digest  # digest imports this module
+            digest = render_digest(digest, fields)
+        head = [{"id": "digest", "text": digest}] if digest else []
+        return head + table_ctx + _targeted(protocol_chunks, focus, n_targeted, max_chars=1200)
+    table_ctx = select_tables(tables or [], focus)
     # prefer CRO-critical sections
     kw = ["inclusion","exclusion","eligibility","endpoint","visit","schedule","site selection","feasibility","recruit","enrollment","budget","cost","monitoring","SDV","decentralized","randomization","statistics","power","sample size","drug supply","safety","DSMB","pharmacovigilance","logistics","labs","ePRO","eCOA","IWRS","EDC","diversity","regulatory"]
     pref = [c for c in protocol_chunks if any(w in c["text"].lower() for w in kw)]
     if not pref: pref = protocol_chunks
-    return [c["text"][:3000] for c in pref[:k]]
-
-def _force_long_paragraph(llm: LLMBase, title: str, ask: str, mcp_blob: str, ctgov_listing: str, prot_ctx: List[str]) -> str:
+    # those closest to this section's ask first, so each section's evidence (and its amendment
+    # fingerprint) depends on its own chunks rather than the same first k for every section
+    terms = {w for w in re.findall(r"[a-z][a-z/\-]{3,}", focus.lower())}
+    if terms:
+        pref = sorted(pref, key=lambda c: -sum(c["text"].lower().count(w) for w in terms))
+    # keep chunk ids so [Prot:i] citations resolve to original (pre-dedup) chunk ids
+    return table_ctx + [{"id": c["id"], "text": c["text"][:3000]} for c in pref[:k]]
+
+def _targeted(protocol_chunks: List[dict], focus: str, n: int, max_chars: int = 3000) -> List[dict]:
+    terms = {w for w in re.findall(r"[a-z][a-z/\-]{3,}", focus.lower())}
+    if not terms or n <= 0:
+        return []
+    scored = []
+    for c in protocol_chunks:
+        t = c["text"].lower()
+        score = sum(t.count(w) for w in terms)
+        if score:
+            scored.append((score, c["id"], c))
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return [{"id": c["id"], "text": _excerpt(c["text"], terms, max_chars)} for _, _, c in scored[:n]]
+
+def _excerpt(text: str, terms, max_chars: int) -> str:
+    # max_chars window starting just before the first focus term, rather than the chunk head
+    if len(text) <= max_chars:
+        return text
+    t = text.lower()
+    first = min((i for i in (t.find(w) for w in terms) if i >= 0), default=0)
+    start = max(0, min(first - max_chars // 6, len(text) - max_chars))
+    return text[start:start + max_chars]
+
+def _force_long_paragraph(llm: LLMBase, title: str, ask: str, mcp_blob: str, ctgov_listing: str, prot_ctx: List[dict]) -> str:
     """
     Single long paragraph, 200–400 words minimum, explicit citations.
     """
+    ctgov_listing = render_precedents(ctgov_listing)  # accepts a ready str, study frame or dicts
+    source_notes = ""
+    if any(c["id"] == "digest" for c in prot_ctx):
+        source_notes = "\n- Source[digest] is a protocol digest; its facts already carry [Prot:i] citations, reuse them."
+    if any(str(c["id"]).startswith("T") for c in prot_ctx):
+        source_notes += "\n- Source[T<n>] entries are protocol tables as TSV (first line is the header row); cite them as [Table:T<n>]."
     guidance = f"""
 Write a CRO-grade, detailed paragraph for **{title}** (minimum ~250 words).
 Requirements:
 - Base all claims on the provided sources. Use inline citations: [BiMCP] for BiMCP, [CTGov NCTxxxxxx] for registry trials, [Prot:i] for protocol excerpts.
 - Include concrete numbers when present (rates/site/month, screen fail %, timelines, cost deltas).
 - If evidence is missing, state exactly what is missing (e.g., 'Unknown: historical rate/region for ...').
-- Close with a succinct recommendation sentence.
+- Close with a succinct recommendation sentence.{source_notes}
 
 BiMCP OUTPUT (excerpts):
 {mcp_blob[:7000]}
 
-CTGOV PRECEDENTS (abbrev listing):
+CTGOV PRECEDENTS (computed analytics; use these numbers rather than estimating):
 {ctgov_listing}
 
 Now, use these protocol excerpts as primary grounding:
-""" + "\n\n---\n".join([f"Source[{i}]:\n{t}" for i,t in enumerate(prot_ctx)])
+""" + "\n\n---\n".join([f"Source[{c['id']}]:\n{c['text']}" for c in prot_ctx])
 
     prompt = f"""{guidance}
 
@@ -52,133 +112,134 @@ Answer:"""
     return _fallback_generate(llm, prompt)
 
 # ---------- Section Generators (25+) ----------
-def sec_enrollment_forecast(llm, prot, mcp_blob, ctlist): 
+def sec_enrollment_forecast(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Quantify total sites, startup lag, enrollment rate/site/month, screen fail %, and months to full enrollment; "
            "justify using BiMCP and CTGov precedents; cite protocol constraints that influence rates.")
-    return _force_long_paragraph(llm, "Enrollment Forecast", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Enrollment Forecast", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sample_size", "sites", "inclusion_criteria")))
 
-def sec_enrollment_optimizations(llm, prot, mcp_blob, ctlist):
+def sec_enrollment_optimizations(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Provide operational and I/E adjustments that increase accrual without compromising integrity; "
            "include pre-screening flows, referral networks, lab threshold tweaks, and digital outreach; quantify expected uplift.")
-    return _force_long_paragraph(llm, "Enrollment Optimizations", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Enrollment Optimizations", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("inclusion_criteria", "exclusion_criteria", "sites")))
 
-def sec_inclusion_exclusion_mods(llm, prot, mcp_blob, ctlist):
+def sec_inclusion_exclusion_mods(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Recommend precise inclusion/exclusion edits linked to feasibility drivers; quantify likely accrual impact and safety tradeoffs.")
-    return _force_long_paragraph(llm, "Inclusion/Exclusion Modifications", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Inclusion/Exclusion Modifications", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("inclusion_criteria", "exclusion_criteria")))
 
-def sec_screen_fail_reduction(llm, prot, mcp_blob, ctlist):
+def sec_screen_fail_reduction(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Propose measures to reduce screen failure (central adjudication, run-in, lab re-tests) and estimate impact on randomization yield.")
-    return _force_long_paragraph(llm, "Screen Failure Reduction", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Screen Failure Reduction", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("inclusion_criteria", "exclusion_criteria", "safety_labs")))
 
-def sec_pre_screening_pipeline(llm, prot, mcp_blob, ctlist):
+def sec_pre_screening_pipeline(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Design a central pre-screening pipeline with inclusion logic, ePRO capture, and referral handling; estimate throughput and hit rate.")
-    return _force_long_paragraph(llm, "Central Pre‑Screening Pipeline", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Central Pre‑Screening Pipeline", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("inclusion_criteria", "exclusion_criteria")))
 
-def sec_site_selection(llm, prot, mcp_blob, ctlist):
+def sec_site_selection(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Recommend site profiles/regions based on historic performance; propose initial allocation by region and ramp curve.")
-    return _force_long_paragraph(llm, "Site Selection & Regional Mix", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Site Selection & Regional Mix", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sites", "sample_size")))
 
-def sec_startup_timeline(llm, prot, mcp_blob, ctlist):
+def sec_startup_timeline(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Lay out realistic milestones (FPI, 25%/50%, LPI, DB lock, CSR) with assumptions and gating risks; map to operational levers.")
-    return _force_long_paragraph(llm, "Startup & Timeline", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Startup & Timeline", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sites", "sample_size", "visit_schedule")))
 
-def sec_monitoring_strategy(llm, prot, mcp_blob, ctlist):
+def sec_monitoring_strategy(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Define on-site vs remote monitoring cadence with rationale and risk controls; include SDV strategy and cost impact.")
-    return _force_long_paragraph(llm, "Monitoring & SDV Strategy", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Monitoring & SDV Strategy", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("visit_schedule", "endpoints", "sites")))
 
-def sec_central_labs(llm, prot, mcp_blob, ctlist):
+def sec_central_labs(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Recommend central vs local labs, logistics/turnaround, reflex testing; quantify quality and cost effects.")
-    return _force_long_paragraph(llm, "Central Labs & Diagnostics", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Central Labs & Diagnostics", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("safety_labs", "visit_schedule")))
 
-def sec_epro_ecoa(llm, prot, mcp_blob, ctlist):
+def sec_epro_ecoa(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Propose ePRO/eCOA plan including instrument schedule, reminders, compliance analytics; estimate data completeness gains.")
-    return _force_long_paragraph(llm, "ePRO/eCOA Plan", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "ePRO/eCOA Plan", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("visit_schedule", "endpoints")))
 
-def sec_dct_visits(llm, prot, mcp_blob, ctlist):
+def sec_dct_visits(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Define decentralized options (home nursing, tele-visits, mobile phlebotomy) and impact on retention/enrollment.")
-    return _force_long_paragraph(llm, "Decentralized Visits (DCT)", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Decentralized Visits (DCT)", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("visit_schedule",)))
 
-def sec_iwrs_edc(llm, prot, mcp_blob, ctlist):
+def sec_iwrs_edc(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Optimize IWRS/EDC config (randomization blocks, kit buffers, edit checks) to reduce errors/stockouts/delays.")
-    return _force_long_paragraph(llm, "IWRS/EDC Configuration", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "IWRS/EDC Configuration", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sample_size", "visit_schedule")))
 
-def sec_logistics_courier(llm, prot, mcp_blob, ctlist):
+def sec_logistics_courier(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Plan courier/temperature lanes and weekend coverage to prevent visit cancellations; quantify avoided deviations.")
-    return _force_long_paragraph(llm, "Logistics & Courier Strategy", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Logistics & Courier Strategy", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("visit_schedule", "safety_labs")))
 
-def sec_drug_supply(llm, prot, mcp_blob, ctlist):
+def sec_drug_supply(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Design drug supply strategy (buffers, expiry, resupply rules) linked to ramp; compute risk to last-patient-in.")
-    return _force_long_paragraph(llm, "Drug Supply & Resupply", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Drug Supply & Resupply", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sample_size", "visit_schedule")))
 
-def sec_safety_monitoring(llm, prot, mcp_blob, ctlist):
+def sec_safety_monitoring(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Detail safety monitoring schedule, lab triggers, SAE/AE flows; align with similar trials’ event rates.")
-    return _force_long_paragraph(llm, "Safety Monitoring", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Safety Monitoring", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("safety_labs", "visit_schedule")))
 
-def sec_dsmb_plan(llm, prot, mcp_blob, ctlist):
+def sec_dsmb_plan(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Define DSMB cadence, stopping boundaries, unblinding safeguards; align with precedent trials.")
-    return _force_long_paragraph(llm, "DSMB Plan", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "DSMB Plan", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("safety_labs", "sample_size")))
 
-def sec_risk_mitigation(llm, prot, mcp_blob, ctlist):
+def sec_risk_mitigation(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Enumerate top operational/statistical risks with mitigations tied to evidence; include backup vendors/sites.")
-    return _force_long_paragraph(llm, "Risk Register & Mitigations", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Risk Register & Mitigations", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sample_size", "sites", "endpoints")))
 
-def sec_protocol_simplification(llm, prot, mcp_blob, ctlist):
+def sec_protocol_simplification(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Propose ways to simplify visits/procedures/forms while preserving endpoints; quantify staff time saved.")
-    return _force_long_paragraph(llm, "Protocol Simplification", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Protocol Simplification", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("visit_schedule", "endpoints")))
 
-def sec_visit_schedule_opt(llm, prot, mcp_blob, ctlist):
+def sec_visit_schedule_opt(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Optimize visit windows/scheduling to reduce cancellations and burden; estimate retention improvement.")
-    return _force_long_paragraph(llm, "Visit Schedule Optimization", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Visit Schedule Optimization", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("visit_schedule",)))
 
-def sec_endpoint_clarity(llm, prot, mcp_blob, ctlist):
+def sec_endpoint_clarity(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Clarify endpoints/assessments to minimize ambiguity and deviations; cross-check with precedent measures.")
-    return _force_long_paragraph(llm, "Endpoint Clarity", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Endpoint Clarity", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("endpoints", "visit_schedule")))
 
-def sec_stat_power(llm, prot, mcp_blob, ctlist):
+def sec_stat_power(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Discuss power assumptions based on historical variability and event rates; recommend adjustments.")
-    return _force_long_paragraph(llm, "Statistical Power Assumptions", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Statistical Power Assumptions", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sample_size", "endpoints")))
 
-def sec_sample_size_recalc(llm, prot, mcp_blob, ctlist):
+def sec_sample_size_recalc(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Outline blinded sample-size re-estimation options and triggers; align with precedent feasibility.")
-    return _force_long_paragraph(llm, "Sample Size Re‑Estimation", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Sample Size Re‑Estimation", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sample_size", "endpoints")))
 
-def sec_rescue_sites(llm, prot, mcp_blob, ctlist):
+def sec_rescue_sites(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Plan rescue sites activation criteria and rapid start-up playbook; estimate time saved to LPI.")
-    return _force_long_paragraph(llm, "Rescue Sites Plan", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Rescue Sites Plan", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sites", "sample_size")))
 
-def sec_kol_engagement(llm, prot, mcp_blob, ctlist):
+def sec_kol_engagement(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Propose KOL engagement and steering to boost screening/referrals and protocol adherence.")
-    return _force_long_paragraph(llm, "KOL Engagement", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "KOL Engagement", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sites", "inclusion_criteria")))
 
-def sec_patient_advocacy(llm, prot, mcp_blob, ctlist):
+def sec_patient_advocacy(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Engage patient orgs for referral and retention; define materials and HIPAA-safe flows.")
-    return _force_long_paragraph(llm, "Patient Advocacy & Outreach", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Patient Advocacy & Outreach", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("inclusion_criteria", "visit_schedule")))
 
-def sec_diversity_inclusion(llm, prot, mcp_blob, ctlist):
+def sec_diversity_inclusion(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Diversity plan with region/site tactics, community partners, and metrics; tie to similar trials’ demographics.")
-    return _force_long_paragraph(llm, "Diversity & Inclusion Strategy", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Diversity & Inclusion Strategy", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("inclusion_criteria", "exclusion_criteria", "sites")))
 
-def sec_feasibility_budget(llm, prot, mcp_blob, ctlist):
+def sec_feasibility_budget(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Budget levers (bundled rates, pass-throughs), milestone-based payments; quantify % savings.")
-    return _force_long_paragraph(llm, "Feasibility & Budgeting", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Feasibility & Budgeting", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("visit_schedule", "safety_labs", "sites")))
 
-def sec_contracting_startup(llm, prot, mcp_blob, ctlist):
+def sec_contracting_startup(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Accelerate startup via parallel submissions, template CDAs/CTAs, safety letters; estimate weeks saved.")
-    return _force_long_paragraph(llm, "Contracting & Start‑up Acceleration", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Contracting & Start‑up Acceleration", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("sites",)))
 
-def sec_regulatory_strategy(llm, prot, mcp_blob, ctlist):
+def sec_regulatory_strategy(llm, prot, mcp_blob, ctlist, digest="", tables=None):
     ask = ("Regulatory engagement plan (scientific advice/pre-IND/type C), alignment with prior approvals; risk/benefit.")
-    return _force_long_paragraph(llm, "Regulatory Strategy", ask, mcp_blob, ctlist, _ctx(prot, 20))
+    return _force_long_paragraph(llm, "Regulatory Strategy", ask, mcp_blob, ctlist, _ctx(prot, 20, digest, ask, tables=tables, fields=("endpoints", "safety_labs")))
 
-# registry of functions so you can add/remove easily
+# registry of functions so you can add/remove easily; optional "budget" overrides
+# llm.default_budget (max_tokens, stop, deadline_s) for that section
 SECTIONS: List[Dict[str, Any]] = [
-    {"title":"Enrollment Forecast", "fn": sec_enrollment_forecast},
+    {"title":"Enrollment Forecast", "fn": sec_enrollment_forecast, "budget": {"max_tokens": 2048, "deadline_s": 240}},
     {"title":"Enrollment Optimizations", "fn": sec_enrollment_optimizations},
     {"title":"Inclusion/Exclusion Modifications", "fn": sec_inclusion_exclusion_mods},
     {"title":"Screen Failure Reduction", "fn": sec_screen_fail_reduction},
     {"title":"Central Pre‑Screening Pipeline", "fn": sec_pre_screening_pipeline},
     {"title":"Site Selection & Regional Mix", "fn": sec_site_selection},
-    {"title":"Startup & Timeline", "fn": sec_startup_timeline},
+    {"title":"Startup & Timeline", "fn": sec_startup_timeline, "budget": {"max_tokens": 2048, "deadline_s": 240}},
     {"title":"Monitoring & SDV Strategy", "fn": sec_monitoring_strategy},
     {"title":"Central Labs & Diagnostics", "fn": sec_central_labs},
     {"title":"ePRO/eCOA Plan", "fn": sec_epro_ecoa},
@@ -188,7 +249,7 @@ SECTIONS: List[Dict[str, Any]] = [
     {"title":"Drug Supply & Resupply", "fn": sec_drug_supply},
     {"title":"Safety Monitoring", "fn": sec_safety_monitoring},
     {"title":"DSMB Plan", "fn": sec_dsmb_plan},
-    {"title":"Risk Register & Mitigations", "fn": sec_risk_mitigation},
+    {"title":"Risk Register & Mitigations", "fn": sec_risk_mitigation, "budget": {"max_tokens": 2048, "deadline_s": 240}},
     {"title":"Protocol Simplification", "fn": sec_protocol_simplification},
     {"title":"Visit Schedule Optimization", "fn": sec_visit_schedule_opt},
     {"title":"Endpoint Clarity", "fn": sec_endpoint_clarity},
@@ -198,7 +259,7 @@ SECTIONS: List[Dict[str, Any]] = [
     {"title":"KOL Engagement", "fn": sec_kol_engagement},
     {"title":"Patient Advocacy & Outreach", "fn": sec_patient_advocacy},
     {"title":"Diversity & Inclusion Strategy", "fn": sec_diversity_inclusion},
-    {"title":"Feasibility & Budgeting", "fn": sec_feasibility_budget},
+    {"title":"Feasibility & Budgeting", "fn": sec_feasibility_budget, "budget": {"max_tokens": 2048, "deadline_s": 240}},
     {"title":"Contracting & Start‑up Acceleration", "fn": sec_contracting_startup},
     {"title":"Regulatory Strategy", "fn": sec_regulatory_strategy},
 ]
@@ -0,0 +1,102 @@
+# modules/amendment.py
+from __future__ import annotations
+from typing import List, Dict, Any, Optional
+import os, re, json, hashlib
+from .digest import chunk_hash
+
+# Run manifest: what each section's prompt was built from, so an amended protocol
+# only regenerates sections whose evidence changed.
+_SRC = re.compile(r"Source\[(\d+)\]|\[Prot:(\d+)\]")
+
+def chunk_hashes(chunks: List[dict]) -> Dict[int, str]:
+    return {c["id"]: chunk_hash(c) for c in chunks}
+
+def cited_chunk_ids(prompt: str) -> List[int]:
+    ids = []
+    for m in _SRC.finditer(prompt):
+        i = int(m.group(1) or m.group(2))
+        if i not in ids:
+            ids.append(i)
+    return ids
+
+def evidence_fingerprint(prompt: str, hashes: Dict[int, str]) -> str:
+    """
+    Hash of a section prompt with excerpt ids (Source[i]) replaced by chunk content hashes, so
+    chunk renumbering alone (pages inserted elsewhere) does not count as changed evidence.
+    Digest facts' [Prot:i] citations are dropped: the fact text is the evidence, and an edit
+    elsewhere in a cited chunk that leaves the fact unchanged should not regenerate the section.
+    """
+    def sub(m):
+        if m.group(2):
+            return ""
+        i = int(m.group(1))
+        return f"<{hashes.get(i, i)}>"
+    return hashlib.sha256(_SRC.sub(sub, prompt).encode("utf-8")).hexdigest()
+
+def remap_citations(text: str, old_hashes: Dict[int, str], new_hashes: Dict[int, str]) -> str:
+    # rewrite [Prot:old_id] to the id the same chunk content has in the amended protocol
+    by_hash = {h: i for i, h in new_hashes.items()}
+    def sub(m):
+        i = int(m.group(1))
+        new = by_hash.get(old_hashes.get(i))
+        return f"[Prot:{new}]" if new is not None else m.group(0)
+    return re.sub(r"\[Prot:(\d+)\]", sub, text)
+
+def diff_chunks(old_hashes: Dict[int, str], new_hashes: Dict[int, str]) -> Dict[str, int]:
+    old, new = set(old_hashes.values()), set(new_hashes.values())
+    return {"unchanged": len(old & new), "added": len(new - old), "removed": len(old - new)}
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def protocol_record(path: str) -> Dict[str, str]:
+    # where the run's protocol lives, so the run can be rebuilt later (finetune/prepare_dataset.py)
+    return {"path": os.path.abspath(path), "sha256": file_sha256(path)}
+
+def load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        m = json.load(f)
+    # JSON object keys are strings; chunk ids are ints everywhere else
+    m["chunks"] = {int(k): v for k, v in m.get("chunks", {}).items()}
+    return m
+
+def save_manifest(path: str, hashes: Dict[int, str], sections: Dict[str, Dict[str, Any]], **extra):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"chunks": hashes, "sections": sections, **extra}, f)
+
+class SectionTracker:
+    """
+    Records each section's evidence for the run manifest and, given a prior manifest and
+    report, hands back the prior section text when that section's evidence is unchanged.
+    """
+    def __init__(self, hashes: Dict[int, str], prior: Optional[Dict[str, Any]] = None, prior_sections: Optional[Dict[str, str]] = None):
+        self.hashes = hashes
+        self.prior = prior or {}
+        self.prior_sections = prior_sections or {}
+        self.sections: Dict[str, Dict[str, Any]] = {}
+        self.reused: List[str] = []
+
+    def reuse(self, title: str, prompt: str) -> Optional[str]:
+        before = self.prior.get("sections", {}).get(title)
+        text = self.prior_sections.get(title)
+        if not before or not text or before.get("partial") or before.get("fingerprint") != evidence_fingerprint(prompt, self.hashes):
+            return None
+        self.reused.append(title)
+        return remap_citations(text, self.prior.get("chunks", {}), self.hashes)
+
+    def record(self, title: str, prompt: str):
+        self.sections[title] = {
+            "fingerprint": evidence_fingerprint(prompt, self.hashes),
+            "chunks": cited_chunk_ids(prompt),
+        }
+
+    def mark_partial(self, title: str):
+        # a section cut off by its generation deadline is always regenerated next run
+        self.sections.setdefault(title, {})["partial"] = True
@@ -1,8 +1,9 @@
 # modules/analyzer.py
 from __future__ import annotations
-from typing import List, Dict, Any
+from typing import List
 import re, json
 from .llm import ask_with_grounding, LLMBase
+from .precedents import render_precedents
 
 def _mk_context(protocol_chunks: List[dict], k: int) -> List[str]:
     # Prefer chunks with CRO-relevant keywords
@@ -18,21 +19,15 @@ def _mk_context(protocol_chunks: List[dict], k: int) -> List[str]:
         preferred = protocol_chunks
     return [c["text"][:3000] for c in preferred[:k]]
 
-def _mk_ctgov_context(ctgov_items: List[Dict[str, Any]], maxn: int = 30) -> str:
-    lines = []
-    for it in ctgov_items[:maxn]:
-        tag = it.get("nctId")
-        title = it.get("briefTitle")
-        status = it.get("overallStatus")
-        phase = it.get("phases")
-        lines.append(f"[CTGov {tag}] {title} | status={status} | phase={phase}")
-    return "\n".join(lines)
+def _mk_ctgov_context(ctgov_items, maxn: int = 30) -> str:
+    # computed precedent analytics + the largest `maxn` studies for citation
+    return render_precedents(ctgov_items, listing_n=maxn)
 
 def cro_analyze(
     llm: LLMBase,
     protocol_chunks: List[dict],
     mcp_blob: str,
-    ctgov_items: List[Dict[str, Any]],
+    ctgov_items,
     k: int = 20,
     strict: bool = True
 ) -> str:
@@ -95,7 +90,7 @@ Use these inputs in addition to the protocol excerpts:
 [MCP]
 {mcp_blob[:7000]}
 
-- ClinicalTrials.gov precedents (abbrev listing):
+- ClinicalTrials.gov precedents (computed analytics + listing):
 {ct_ctx}
 
 Format strictly in Markdown with H2 headings per section and inline citations like [BiMCP], [CTGov NCT05938036], [Prot:0].
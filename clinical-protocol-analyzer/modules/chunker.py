@@ -1,11 +1,17 @@
 from __future__ import annotations
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
 import re
 
-def _split_by_delimiters(text: str, size: int, overlap: int) -> List[str]:
-    # Try to respect headings; fallback to paragraphs/sentences
-    blocks = re.split(r"\n(?=[A-Z][A-Z0-9 ._-]{4,}\n)", text)
-    if len(blocks) == 1:
+def _split_by_delimiters(text: str, size: int, overlap: int) -> List[Tuple[str, int]]:
+    return _with_overlap(_split_blocks(text, size), size, overlap)
+
+_HEADING = re.compile(r"\n(?=[A-Z][A-Z0-9 ._-]{4,}\n)")
+
+def _split_blocks(text: str, size: int, headings: Optional[bool] = None) -> List[str]:
+    # Try to respect headings; fallback to paragraphs/sentences. headings=True keeps heading mode
+    # for text without one (a window of a document that has headings elsewhere)
+    blocks = _HEADING.split(text)
+    if len(blocks) == 1 and not headings:
         blocks = text.split("\n\n")
     chunks = []
     for block in blocks:
@@ -23,17 +29,63 @@ def _split_by_delimiters(text: str, size: int, overlap: int) -> List[str]:
                 buff = s + " "
         if buff:
             chunks.append(buff.strip())
+    return chunks
+
+def _with_overlap(chunks: List[str], size: int, overlap: int, prev_chunk: Optional[str] = None) -> List[Tuple[str, int]]:
+    # (text, lead): lead = chars at the start of text carried over from the previous block
     with_overlap = []
     for i, ch in enumerate(chunks):
-        if i == 0:
-            with_overlap.append(ch)
+        prev = chunks[i-1] if i else prev_chunk
+        if prev is None:
+            with_overlap.append((ch, 0))
             continue
-        prev = chunks[i-1]
         tail = prev[-overlap:]
         combined = (tail + ch)[- (size + overlap):]
-        with_overlap.append(combined)
-    return [c.strip() for c in with_overlap if c.strip()]
+        with_overlap.append((combined, max(0, len(combined) - len(ch))))
+    out = []
+    for c, lead in with_overlap:
+        s = c.lstrip()
+        lead = max(0, lead - (len(c) - len(s)))
+        s = s.rstrip()
+        if s:
+            out.append((s, min(lead, len(s))))
+    return out
 
 def chunk_text(text: str, size: int = 2500, overlap: int = 300) -> List[Dict]:
     parts = _split_by_delimiters(text, size=size, overlap=overlap)
-    return [{"id": i, "text": p} for i, p in enumerate(parts)]
+    return [{"id": i, "text": p, "lead": lead} for i, (p, lead) in enumerate(parts)]
+
+def iter_chunks(texts: Iterable[str], size: int = 2500, overlap: int = 300, window: int = 16) -> Iterator[Dict]:
+    """
+    chunk_text over a text stream (low-memory mode): text is buffered up to ~window*size chars,
+    split at the last heading (else the last paragraph break), and the remainder carried into
+    the next window. Once a heading has been seen the whole stream stays in heading mode, as
+    chunk_text decides for the whole document, so windows cut at headings chunk exactly like
+    chunk_text. Boundaries can still differ before the first heading and where a heading-less
+    stretch is longer than a window.
+    """
+    buf, prev, i = "", None, 0
+    headings = False
+    def emit(text):
+        nonlocal prev, i
+        raw = _split_blocks(text, size, headings)
+        if prev is not None and raw and not raw[0].strip():
+            raw = raw[1:]  # the separator the window was cut at; blank blocks elsewhere stay as in chunk_text
+        for c, lead in _with_overlap(raw, size, overlap, prev):
+            yield {"id": i, "text": c, "lead": lead}
+            i += 1
+        if raw:
+            prev = raw[-1]
+    for t in texts:
+        buf += t
+        if len(buf) < window * size:
+            continue
+        heads = [m.start() for m in _HEADING.finditer(buf, size)]
+        headings = headings or bool(heads)
+        cut = heads[-1] if heads else buf.rfind("\n\n", size)
+        if cut <= 0:
+            continue
+        yield from emit(buf[:cut])
+        buf = buf[cut:]
+    if buf.strip():
+        yield from emit(buf)
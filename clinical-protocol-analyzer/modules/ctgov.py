@@ -1,10 +1,12 @@
 # modules/ctgov.py
 from __future__ import annotations
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional, Iterable, Iterator, Union
+from dataclasses import dataclass, field
 import requests
 from urllib.parse import quote_plus
 from tenacity import retry, stop_after_attempt, wait_fixed
-import re
+import re, os, json
+import pandas as pd
 
 API = "https://clinicaltrials.gov/api/v2/studies"
 
@@ -41,38 +43,154 @@ def _query_once(condition: str, intervention: str, limit: int = 100, timeout: in
     return r.json()
 
 def query_studies_variants(entities: Dict[str, Any], limit: int = 100, timeout: int = 30, max_pairs: int = 6) -> List[Dict[str, Any]]:
+    return list(iter_studies_variants(entities, limit=limit, timeout=timeout, max_pairs=max_pairs))
+
+def iter_studies_variants(entities: Dict[str, Any], limit: int = 100, timeout: int = 30, max_pairs: int = 6) -> Iterator[Dict[str, Any]]:
+    # one response blob at a time, so callers can parse and drop each before the next request
     conds, intrs = _variants_from_entities(entities)
-    out, n = [], 0
+    n = 0
     for c in conds:
         for i in intrs:
             if n >= max_pairs: break
             try:
-                out.append(_query_once(c, i, limit=limit, timeout=timeout))
+                blob = _query_once(c, i, limit=limit, timeout=timeout)
             except Exception:
-                pass
+                blob = None
             n += 1
+            if blob is not None:
+                yield blob
         if n >= max_pairs: break
-    return out
 
-def simplify_ctgov(json_obj: Dict[str, Any]) -> List[Dict[str, Any]]:
-    studies = json_obj.get("studies", [])
-    simplified = []
-    for s in studies:
+@dataclass(slots=True)
+class Study:
+    """Compact CTGov study record; to_dict() keeps the v2 API field names used on disk."""
+    nctId: Optional[str] = None
+    briefTitle: Optional[str] = None
+    overallStatus: Optional[str] = None
+    startDate: Optional[str] = None
+    completionDate: Optional[str] = None
+    studyType: Optional[str] = None
+    phases: List[str] = field(default_factory=list)
+    conditions: List[str] = field(default_factory=list)
+    interventions: List[Dict[str, Any]] = field(default_factory=list)
+    enrollmentCount: Optional[int] = None
+    siteCount: Optional[int] = None
+    countries: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_api(cls, s: Dict[str, Any]) -> "Study":
         ps = s.get("protocolSection", {})
         ident = ps.get("identificationModule", {})
         status = ps.get("statusModule", {})
         design = ps.get("designModule", {})
         conds = ps.get("conditionsModule", {})
         arms = ps.get("armsInterventionsModule", {})
-        simplified.append({
-            "nctId": ident.get("nctId"),
-            "briefTitle": ident.get("briefTitle"),
-            "overallStatus": status.get("overallStatus"),
-            "startDate": (status.get("startDateStruct") or {}).get("date"),
-            "completionDate": (status.get("completionDateStruct") or {}).get("date"),
-            "studyType": design.get("studyType"),
-            "phases": design.get("phases"),
-            "conditions": conds.get("conditions"),
-            "interventions": arms.get("interventions"),
-        })
-    return simplified
+        locs = (ps.get("contactsLocationsModule") or {}).get("locations") or []
+        return cls(
+            nctId=ident.get("nctId"),
+            briefTitle=ident.get("briefTitle"),
+            overallStatus=status.get("overallStatus"),
+            startDate=(status.get("startDateStruct") or {}).get("date"),
+            completionDate=(status.get("completionDateStruct") or {}).get("date"),
+            studyType=design.get("studyType"),
+            phases=design.get("phases") or [],
+            conditions=conds.get("conditions") or [],
+            interventions=arms.get("interventions") or [],
+            enrollmentCount=(design.get("enrollmentInfo") or {}).get("count"),
+            siteCount=len(locs) if locs else None,
+            countries=_unique([l.get("country") for l in locs]),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {f: getattr(self, f) for f in self.__slots__}
+
+def parse_studies(json_obj: Dict[str, Any]) -> List[Study]:
+    return [Study.from_api(s) for s in json_obj.get("studies", [])]
+
+def simplify_ctgov(json_obj: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [s.to_dict() for s in parse_studies(json_obj)]
+
+# ---------- Columnar storage ----------
+# scalars stay scalar; phases/countries are "|"-joined; nested lists/dicts are JSON strings
+_LIST_COLS = ["conditions", "interventions"]
+_JOINED_COLS = ["phases", "countries"]
+
+def studies_frame(studies: Iterable[Union[Study, Dict[str, Any]]]) -> pd.DataFrame:
+    rows = [s.to_dict() if isinstance(s, Study) else s for s in studies]
+    df = pd.DataFrame(rows, columns=list(Study.__slots__))
+    for c in _JOINED_COLS:
+        df[c] = df[c].map(lambda p: "|".join(p) if isinstance(p, list) else (p if isinstance(p, str) else ""))
+    for c in ["enrollmentCount", "siteCount"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64")
+    for c in _LIST_COLS:
+        df[c] = df[c].map(lambda v: v if isinstance(v, str) else json.dumps(v or []))
+    for c in ["nctId", "overallStatus", "studyType"]:
+        df[c] = df[c].astype("string")
+    df["overallStatus"] = df["overallStatus"].astype("category")
+    return df
+
+def dedup_studies(df: pd.DataFrame) -> pd.DataFrame:
+    return df[df["nctId"].notna()].drop_duplicates("nctId", keep="first").reset_index(drop=True)
+
+def filter_studies(
+    df: pd.DataFrame,
+    phases: Optional[List[str]] = None,
+    statuses: Optional[List[str]] = None,
+    start_after: Optional[str] = None,
+    start_before: Optional[str] = None,
+) -> pd.DataFrame:
+    mask = pd.Series(True, index=df.index)
+    if phases:
+        mask &= df["phases"].str.contains("|".join(map(re.escape, phases)), regex=True, na=False)
+    if statuses:
+        mask &= df["overallStatus"].isin(statuses)
+    if start_after or start_before:
+        start = pd.to_datetime(df["startDate"], errors="coerce", format="mixed")
+        if start_after:
+            mask &= start >= pd.Timestamp(start_after)
+        if start_before:
+            mask &= start <= pd.Timestamp(start_before)
+    return df[mask]
+
+def save_studies(df: pd.DataFrame, path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        frame_to_items(df, path_out=path)
+
+def load_studies(path: str) -> pd.DataFrame:
+    if path.endswith(".parquet"):
+        # files written before a column existed just get it as missing values
+        return pd.read_parquet(path).reindex(columns=list(Study.__slots__))
+    if not os.path.getsize(path):
+        return studies_frame([])
+    return studies_frame(pd.read_json(path, lines=True, dtype=False).to_dict("records"))
+
+def frame_to_items(df: pd.DataFrame, path_out: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Back to the per-study dict shape (optionally written as JSONL)."""
+    out = df.astype(object).where(df.notna(), None)
+    for c in _JOINED_COLS:
+        if c in out:
+            out[c] = out[c].map(lambda p: p.split("|") if p else [])
+    for c in _LIST_COLS:
+        out[c] = out[c].map(lambda v: json.loads(v) if v else [])
+    items = out.to_dict("records")
+    if path_out:
+        with open(path_out, "w", encoding="utf-8") as f:
+            for it in items:
+                f.write(json.dumps(it) + "\n")
+    return items
+
+def ctgov_listing(ctlist: Union[str, pd.DataFrame, List[Dict[str, Any]]], maxn: int = 30) -> str:
+    """Abbreviated `[CTGov NCT..] title | status | phase` listing for prompts."""
+    if isinstance(ctlist, str):
+        return ctlist
+    df = ctlist if isinstance(ctlist, pd.DataFrame) else studies_frame(ctlist or [])
+    head = df.head(maxn)
+    if head.empty:
+        return ""
+    col = lambda c: head[c].astype(object).fillna("").astype(str)
+    lines = ("[CTGov " + col("nctId") + "] " + col("briefTitle")
+             + " | status=" + col("overallStatus") + " | phase=" + col("phases"))
+    return "\n".join(lines.tolist())
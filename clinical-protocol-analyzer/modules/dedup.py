@@ -0,0 +1,101 @@
+# modules/dedup.py
+from __future__ import annotations
+from typing import List, Dict, Tuple, Iterable, Set
+from collections import Counter, defaultdict
+import re, zlib
+import numpy as np
+
+_MERSENNE = (1 << 31) - 1
+
+def _norm_line(line: str) -> str:
+    # page numbers / dates differ per page: fold digits so "Page 3 of 120" == "Page 4 of 120"
+    return re.sub(r"\d+", "#", re.sub(r"\s+", " ", line)).strip().lower()
+
+def strip_page_boilerplate(pages: List[str], edge_lines: int = 3, min_ratio: float = 0.5) -> List[str]:
+    """
+    Remove running headers/footers: lines within `edge_lines` of a page's top or bottom
+    that recur (digit-insensitive) on at least `min_ratio` of pages.
+    """
+    if len(pages) < 3:
+        return pages
+    boiler = boilerplate_lines(pages, edge_lines, min_ratio)
+    if not boiler:
+        return pages
+    return [strip_boilerplate_page(p, boiler, edge_lines) for p in pages]
+
+def boilerplate_lines(pages: Iterable[str], edge_lines: int = 3, min_ratio: float = 0.5) -> Set[str]:
+    # single pass over any page iterable, keeping only edge-line counts (streamable)
+    counts = Counter()
+    n_pages = 0
+    for p in pages:
+        n_pages += 1
+        lines = [l for l in p.splitlines() if l.strip()]
+        if len(lines) <= 2 * edge_lines:
+            continue  # too short to tell header/footer from body
+        edges = lines[:edge_lines] + lines[-edge_lines:]
+        counts.update({_norm_line(l) for l in edges})
+    if n_pages < 3:
+        return set()
+    floor = max(3, int(n_pages * min_ratio))
+    return {l for l, n in counts.items() if n >= floor and l}
+
+def strip_boilerplate_page(page: str, boiler: Set[str], edge_lines: int = 3) -> str:
+    lines = page.splitlines()
+    nonblank = [i for i, l in enumerate(lines) if l.strip()]
+    if not boiler or len(nonblank) <= 2 * edge_lines:
+        return page
+    edge_idx = set(nonblank[:edge_lines] + nonblank[-edge_lines:])
+    return "\n".join(l for i, l in enumerate(lines) if not (i in edge_idx and _norm_line(l) in boiler))
+
+def _shingles(text: str, size: int) -> np.ndarray:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in set(grams)), dtype=np.uint64)
+
+def minhash_signatures(texts: List[str], num_perm: int = 64, shingle_size: int = 5, seed: int = 1) -> np.ndarray:
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, _MERSENNE, size=num_perm).astype(np.uint64)
+    b = rng.randint(0, _MERSENNE, size=num_perm).astype(np.uint64)
+    sigs = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for i, t in enumerate(texts):
+        sh = _shingles(t, shingle_size)
+        sigs[i] = ((a[:, None] * sh[None, :] + b[:, None]) % _MERSENNE).min(axis=1)
+    return sigs
+
+def dedup_chunks(
+    chunks: List[Dict],
+    threshold: float = 0.85,
+    num_perm: int = 64,
+    shingle_size: int = 5,
+    bands: int = 16,
+) -> Tuple[List[Dict], Dict[int, int]]:
+    """
+    Collapse near-identical chunks (MinHash + LSH banding, estimated Jaccard >= threshold).
+    Returns (kept_chunks, id_map) where id_map sends every original chunk id to the id of
+    the chunk that represents it. Kept chunks retain their original ids. Signatures skip each
+    chunk's "lead" (the overlap carried from the previous block), which differs between
+    otherwise identical repeats.
+    """
+    if not chunks:
+        return [], {}
+    sigs = minhash_signatures([c["text"][c.get("lead", 0):] for c in chunks], num_perm=num_perm, shingle_size=shingle_size)
+    rows = max(1, num_perm // bands)
+    buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+    rep = list(range(len(chunks)))
+    for i in range(len(chunks)):
+        cands = set()
+        for band in range(bands):
+            key = (band, sigs[i, band * rows:(band + 1) * rows].tobytes())
+            cands.update(buckets[key])
+            buckets[key].append(i)
+        # earliest matching representative wins, so the first occurrence is kept
+        for j in sorted(cands):
+            if rep[j] == j and float((sigs[i] == sigs[j]).mean()) >= threshold:
+                rep[i] = j
+                break
+    kept = [c for i, c in enumerate(chunks) if rep[i] == i]
+    id_map = {chunks[i]["id"]: chunks[rep[i]]["id"] for i in range(len(chunks))}
+    return kept, id_map
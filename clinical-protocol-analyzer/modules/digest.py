@@ -0,0 +1,162 @@
+# modules/digest.py
+from __future__ import annotations
+from typing import List, Dict, Any, Optional, Sequence
+from concurrent.futures import ThreadPoolExecutor
+import os, re, json, hashlib
+from .llm import LLMBase
+from .advanced_analyzer import _fallback_generate
+
+# field -> patterns that make a chunk worth summarizing for it. Kept specific: bare words like
+# "visit", "site" or "primary" occur in nearly every chunk of a protocol.
+DIGEST_FIELDS: Dict[str, List[str]] = {
+    "inclusion_criteria": [r"inclusion criteri", r"eligib", r"must (?:have|be)\b", r"\baged? (?:≥|>=|\d)", r"informed consent"],
+    "exclusion_criteria": [r"exclusion criteri", r"must not", r"\bexcluded\b", r"not (?:be )?eligible", r"history of"],
+    "visit_schedule": [r"schedule of (?:activities|assessments|events)", r"visit window", r"(?:±|\+/-) ?\d+ ?(?:day|hour|week)",
+                       r"\bday -?\d+\b", r"\bweek \d+\b", r"screening (?:visit|period)", r"follow-up (?:visit|period)", r"end of (?:treatment|study)"],
+    "endpoints": [r"(?:primary|secondary|exploratory) (?:efficacy )?(?:endpoint|outcome|objective)", r"\bendpoints?\b", r"time to ", r"change from baseline"],
+    "sample_size": [r"sample size", r"\bpower\b", r"randomi[sz]", r"(?:participants|subjects|patients) will be (?:enrolled|randomi[sz]ed)",
+                    r"approximately \d+ (?:participants|subjects|patients)", r"dropout"],
+    "sites": [r"\d+ (?:study )?(?:sites|centers|centres)", r"\bcountr(?:y|ies)\b", r"multi-?cent(?:er|re)", r"principal investigator"],
+    "safety_labs": [r"(?:serious )?adverse events?", r"\bds[mc][bc]\b|data (?:and )?safety monitoring", r"stopping (?:rule|criteri)",
+                    r"\buln\b", r"laborator", r"hematolog|haematolog|chemistry|urinalysis"],
+}
+_FIELD_RES = {k: [re.compile(p, re.I) for p in v] for k, v in DIGEST_FIELDS.items()}
+DIGEST_VERSION = 2  # bump when selection/reduce logic changes so cached digests are rebuilt
+
+def protocol_hash(chunks: List[dict]) -> str:
+    h = hashlib.sha256()
+    for c in chunks:
+        h.update(c["text"].encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _relevant(chunk: dict, min_hits: int = 3) -> bool:
+    # distinct pattern hits across all fields; tables of contents match everything, skip them
+    t = chunk["text"]
+    if t.count("....") >= 5:
+        return False
+    return sum(1 for res in _FIELD_RES.values() for r in res if r.search(t)) >= min_hits
+
+def digest_path(cache_dir: str, chunks: List[dict]) -> str:
+    return os.path.join(cache_dir, f"{protocol_hash(chunks)}.v{DIGEST_VERSION}.json")
+
+def chunk_hash(chunk: dict) -> str:
+    return hashlib.sha256(chunk["text"].encode("utf-8")).hexdigest()
+
+def summarize_chunk(llm: LLMBase, chunk: dict) -> Dict[str, List[str]]:
+    """Map step: compact facts from one chunk (uncited; build_digest attaches [Prot:id])."""
+    fields = ", ".join(DIGEST_FIELDS)
+    prompt = f"""Extract only facts explicitly stated in the protocol excerpt below.
+Return strict JSON with any of these keys: {fields}.
+Each value is an array of short factual strings (numbers, thresholds, windows, counts). Omit keys with no facts.
+
+EXCERPT:
+{chunk["text"][:3000]}
+
+JSON:"""
+    raw = _fallback_generate(llm, prompt)
+    m = re.search(r"\{.*\}", raw, flags=re.S)
+    if not m:
+        return {}
+    try:
+        data = json.loads(m.group(0))
+    except Exception:
+        return {}
+    out = {}
+    for k, v in data.items():
+        if k not in DIGEST_FIELDS:
+            continue
+        if isinstance(v, str): v = [v]
+        facts = [str(x).strip() for x in (v or []) if str(x).strip()]
+        if facts:
+            out[k] = facts
+    return out
+
+def _fact_score(fact: str) -> int:
+    # numbers, thresholds and windows are what sections need; prefer them over prose
+    return len(re.findall(r"\d+(?:\.\d+)?", fact)) + 2 * bool(re.search(r"[≥≤<>±%]|x ?uln", fact, re.I))
+
+def reduce_facts(partials: List[Dict[str, List[str]]], max_per_field: int = 25) -> Dict[str, List[str]]:
+    """
+    Reduce step: merge per-chunk facts (partials in document order), drop repeats (ignoring
+    citation). When a field has more than max_per_field facts, the document is split into
+    max_per_field equal spans and the most specific fact of each span is kept, so facts from
+    late sections (later visits, statistics) survive rather than only the first ones.
+    """
+    digest: Dict[str, List[str]] = {}
+    for k in DIGEST_FIELDS:
+        seen, facts = set(), []
+        for part in partials:
+            for f in part.get(k, []):
+                key = re.sub(r"\s*\[Prot:[^\]]*\]$", "", f).lower()
+                if key not in seen:
+                    seen.add(key)
+                    facts.append(f)
+        if len(facts) > max_per_field:
+            n = len(facts)
+            spans = [facts[i * n // max_per_field:(i + 1) * n // max_per_field] for i in range(max_per_field)]
+            facts = [max(span, key=_fact_score) for span in spans if span]
+        digest[k] = facts
+    return digest
+
+def render_digest(digest: Dict[str, List[str]], fields: Sequence[str] = ()) -> str:
+    # fields: only these digest fields (a section's share of the digest); empty = all
+    lines = []
+    for k, facts in digest.items():
+        if not facts or (fields and k not in fields):
+            continue
+        lines.append(f"{k.replace('_', ' ').upper()}:")
+        lines.extend(f"- {f}" for f in facts)
+    return "\n".join(lines)
+
+def build_digest(
+    llm: LLMBase,
+    chunks: List[dict],
+    cache_dir: str = "data/digest_cache",
+    workers: int = 4,
+    max_per_field: int = 25,
+    log: Optional[Any] = None,
+    min_hits: int = 3,
+) -> Dict[str, List[str]]:
+    """
+    One-time map-reduce digest of the protocol, cached by protocol hash. Map results are
+    also cached per chunk hash (pruned to the last protocol's chunks), so an amended protocol
+    only re-summarizes changed chunks.
+    Backends marked thread_safe = False (llama.cpp) always run with a single worker.
+    """
+    if workers > 1 and not getattr(llm, "thread_safe", True):
+        if log:
+            log.info(f"Digest: {type(llm).__name__} is not thread-safe, using 1 worker instead of {workers}")
+        workers = 1
+    os.makedirs(cache_dir, exist_ok=True)
+    path = digest_path(cache_dir, chunks)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    facts_path = os.path.join(cache_dir, "chunk_facts.json")
+    facts: Dict[str, Dict[str, List[str]]] = {}
+    if os.path.exists(facts_path):
+        with open(facts_path, "r", encoding="utf-8") as f:
+            facts = json.load(f)
+    hashes = [chunk_hash(c) for c in chunks]
+    todo = [(h, c) for h, c in zip(hashes, chunks) if h not in facts and _relevant(c, min_hits)]
+    if log: log.info(f"Digest: summarizing {len(todo)}/{len(chunks)} chunks with {workers} workers")
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(lambda hc: summarize_chunk(llm, hc[1]), todo))
+    else:
+        results = [summarize_chunk(llm, c) for _, c in todo]
+    for (h, _), r in zip(todo, results):
+        facts[h] = r
+    partials = [
+        {k: [f"{x} [Prot:{c['id']}]" for x in v] for k, v in facts.get(h, {}).items()}
+        for h, c in zip(hashes, chunks)
+    ]
+    digest = reduce_facts(partials, max_per_field=max_per_field)
+    # keep only this protocol's chunks: enough for an amendment of it, and the file stays bounded
+    live = set(hashes)
+    with open(facts_path, "w", encoding="utf-8") as f:
+        json.dump({h: v for h, v in facts.items() if h in live}, f)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(digest, f, indent=1)
+    return digest
@@ -1,44 +1,238 @@
 from __future__ import annotations
-from typing import List
-import os
+from typing import List, Optional, Dict, Any
+import os, time
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+QUANTIZATIONS = ("none", "int8", "binary")
+
+def _make_index(embs: np.ndarray, quantization: str):
+    d = embs.shape[1]
+    if quantization == "binary":
+        # sign bit per dimension, Hamming search; d/8 bytes per vector
+        index = faiss.IndexBinaryFlat(d)
+        index.add(np.packbits(embs > 0, axis=1))
+        return index
+    if quantization == "int8":
+        # 1 byte per dimension, per-dimension range trained on the corpus
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(embs)
+        index.add(embs)
+        return index
+    index = faiss.IndexFlatIP(d)
+    index.add(embs)
+    return index
+
+def _index_bytes(embs: np.ndarray, quantization: str) -> int:
+    n, d = embs.shape
+    return n * {"binary": (d + 7) // 8, "int8": d}.get(quantization, 4 * d)
+
+def length_buckets(lengths: List[int], token_budget: int, max_batch: int) -> List[List[int]]:
+    """
+    Sort by length and cut batches so that (batch size x longest item) stays within
+    token_budget, i.e. padded tokens per batch are bounded. Returns index lists.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, cur = [], []
+    for i in order:
+        # sorted ascending, so the item being added is the batch's longest
+        if cur and ((len(cur) + 1) * lengths[i] > token_budget or len(cur) >= max_batch):
+            batches.append(cur); cur = []
+        cur.append(i)
+    if cur:
+        batches.append(cur)
+    return batches
+
 class VectorIndex:
-    def __init__(self, model_name: str, index_path: str, batch_size: int = 64, device: str = "cpu"):
+    def __init__(self, model_name: str, index_path: str, batch_size: int = 64, device: str = "cpu",
+                 token_budget: Optional[int] = None, workers: int = 1,
+                 quantization: str = "none", rescore_factor: int = 4, spill: bool = False):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {quantization}. Use one of {QUANTIZATIONS}.")
         self.model = SentenceTransformer(model_name, device=device)
         self.index_path = index_path
         self.batch_size = batch_size
+        self.token_budget = token_budget  # None = fixed batch_size batches
+        self.workers = workers            # >1 = multi-process encode pool (CPU hosts)
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.spill = spill                # True = embeddings go to a memory-mapped file, index is built in slices
         self.index = None
+        self.vectors = None  # float32 rows for re-scoring quantized shortlists (memory-mapped after load)
         self.ids = []
+        self.stats: Dict[str, Any] = {}
 
-    def build(self, texts: List[str]):
-        embs = self._embed_batch(texts)
-        d = embs.shape[1]
-        self.index = faiss.IndexFlatIP(d)
+    def build(self, texts: List[str], ids: Optional[List[int]] = None):
+        if self.spill:
+            return self._build_spilled(texts, ids)
+        embs = self._embed_corpus(texts)
         faiss.normalize_L2(embs)
-        self.index.add(embs)
-        self.ids = list(range(len(texts)))
+        self.index = _make_index(embs, self.quantization)
+        self.vectors = embs if self.quantization != "none" else None
+        self.ids = list(ids) if ids is not None else list(range(len(texts)))
+        self._save()
+        del embs
+        if self.vectors is not None:
+            # re-scoring rows are paged in from disk as in load(); keeping the float32 matrix
+            # resident next to a quantized index would use more memory than "none"
+            self.vectors = np.load(os.path.join(self.index_path, "vectors.f32.npy"), mmap_mode="r")
+
+    def _build_spilled(self, texts: List[str], ids: Optional[List[int]] = None, slice_rows: int = 4096):
+        """
+        Low-memory build: embeddings are written straight into vectors.f32.npy (memory-mapped)
+        and the faiss index is filled from it in slices, so no second float32 copy is held.
+        """
+        os.makedirs(self.index_path, exist_ok=True)
+        vec_path = os.path.join(self.index_path, "vectors.f32.npy")
+        d = self.model.get_sentence_embedding_dimension()
+        out = np.lib.format.open_memmap(vec_path, mode="w+", dtype="float32", shape=(len(texts), d))
+        self._embed_corpus(texts, out=out)
+        out.flush()
+        del out
+        embs = np.load(vec_path, mmap_mode="r")
+        if self.quantization == "binary":
+            self.index = faiss.IndexBinaryFlat(d)
+        elif self.quantization == "int8":
+            self.index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            sample = np.sort(np.random.RandomState(0).choice(len(embs), size=min(len(embs), 65536), replace=False))
+            self.index.train(np.ascontiguousarray(embs[sample]))
+        else:
+            self.index = faiss.IndexFlatIP(d)
+        for i in range(0, len(embs), slice_rows):
+            part = np.array(embs[i:i + slice_rows], dtype="float32")
+            faiss.normalize_L2(part)
+            self.index.add(np.packbits(part > 0, axis=1) if self.quantization == "binary" else part)
+        self.vectors = embs if self.quantization != "none" else None
+        self.ids = list(ids) if ids is not None else list(range(len(texts)))
         self._save()
 
     def _embed_batch(self, texts: List[str]) -> np.ndarray:
         vectors = self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=False, normalize_embeddings=True)
         return np.array(vectors, dtype="float32")
 
+    def _est_tokens(self, text: str) -> int:
+        # ~4 chars/token; the model truncates at max_seq_length anyway
+        cap = getattr(self.model, "max_seq_length", None) or 512
+        return max(1, min(len(text) // 4 + 2, cap))
+
+    def _embed_corpus(self, texts: List[str], out: Optional[np.ndarray] = None) -> np.ndarray:
+        t0 = time.perf_counter()
+        if self.workers > 1:
+            pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+            # each call's items are split evenly across the workers (one batch each); the library's
+            # default chunk_size (~len/processes/10) is 1 for a bucket, i.e. unbatched encodes
+            try:
+                embs = self._encode_bucketed(texts, lambda batch, bs: self.model.encode_multi_process(
+                    batch, pool, batch_size=bs, chunk_size=max(1, -(-len(batch) // self.workers)),
+                    normalize_embeddings=True), out)
+            finally:
+                self.model.stop_multi_process_pool(pool)
+        else:
+            embs = self._encode_bucketed(texts, lambda batch, bs: self.model.encode(
+                batch, batch_size=bs, show_progress_bar=False, normalize_embeddings=True), out)
+        dt = time.perf_counter() - t0
+        self.stats = {"chunks": len(texts), "seconds": round(dt, 3), "chunks_per_sec": round(len(texts) / dt, 1) if dt > 0 else None}
+        return embs
+
+    def _encode_bucketed(self, texts: List[str], encode, out: Optional[np.ndarray] = None) -> np.ndarray:
+        # with `out` (a memmap), vectors are written batch by batch instead of collected in memory
+        if not self.token_budget:
+            if out is None:
+                return np.array(encode(texts, self.batch_size), dtype="float32")
+            step = max(self.batch_size, 1) * 8
+            batches = [list(range(i, min(i + step, len(texts)))) for i in range(0, len(texts), step)]
+        else:
+            lengths = [self._est_tokens(t) for t in texts]
+            batches = length_buckets(lengths, self.token_budget, max_batch=max(self.batch_size, 1) * 4)
+        for idx in batches:
+            # one encode call per bucket, sized by the token budget rather than batch_size
+            vecs = np.array(encode([texts[i] for i in idx], len(idx)), dtype="float32")
+            if out is None:
+                out = np.empty((len(texts), vecs.shape[1]), dtype="float32")
+            out[idx] = vecs
+        return out if out is not None else np.zeros((0, 0), dtype="float32")
+
     def _save(self):
         os.makedirs(self.index_path, exist_ok=True)
-        faiss.write_index(self.index, os.path.join(self.index_path, "index.faiss"))
-        with open(os.path.join(self.index_path, "ids.txt"), "w") as f:
-            f.write("\n".join(map(str, self.ids)))
+        if self.quantization == "binary":
+            faiss.write_index_binary(self.index, os.path.join(self.index_path, "index.bin"))
+        else:
+            faiss.write_index(self.index, os.path.join(self.index_path, "index.faiss"))
+        if self.vectors is not None and not isinstance(self.vectors, np.memmap):
+            np.save(os.path.join(self.index_path, "vectors.f32.npy"), self.vectors)
+        np.save(os.path.join(self.index_path, "ids.npy"), np.asarray(self.ids, dtype=np.int64))
 
     def load(self):
-        self.index = faiss.read_index(os.path.join(self.index_path, "index.faiss"))
-        with open(os.path.join(self.index_path, "ids.txt"), "r") as f:
-            self.ids = [int(x.strip()) for x in f if x.strip()]
+        if self.quantization == "binary":
+            self.index = faiss.read_index_binary(os.path.join(self.index_path, "index.bin"))
+        else:
+            self.index = faiss.read_index(os.path.join(self.index_path, "index.faiss"))
+        if self.quantization != "none":
+            # only the shortlisted rows are paged in during re-scoring
+            self.vectors = np.load(os.path.join(self.index_path, "vectors.f32.npy"), mmap_mode="r")
+        ids_npy = os.path.join(self.index_path, "ids.npy")
+        if os.path.exists(ids_npy):
+            self.ids = np.load(ids_npy).tolist()
+        else:
+            with open(os.path.join(self.index_path, "ids.txt"), "r") as f:
+                self.ids = [int(x.strip()) for x in f if x.strip()]
 
-    def search(self, queries: List[str], k: int = 8):
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
         q_embs = self._embed_batch(queries)
         faiss.normalize_L2(q_embs)
-        scores, idxs = self.index.search(q_embs, k)
+        return q_embs
+
+    def search(self, queries: List[str], k: int = 8):
+        return self.search_vectors(self.embed_queries(queries), k)
+
+    def search_vectors(self, q_embs: np.ndarray, k: int = 8):
+        if self.quantization == "none":
+            return self.index.search(q_embs, k)
+        # quantized shortlist, then exact float32 inner product on the shortlist only
+        shortlist = min(self.index.ntotal, max(k, k * self.rescore_factor))
+        if self.quantization == "binary":
+            _, cand = self.index.search(np.packbits(q_embs > 0, axis=1), shortlist)
+        else:
+            _, cand = self.index.search(q_embs, shortlist)
+        scores = np.full((len(q_embs), k), -np.inf, dtype="float32")
+        idxs = np.full((len(q_embs), k), -1, dtype="int64")
+        for qi, row in enumerate(cand):
+            row = row[row >= 0]
+            if not len(row):
+                continue
+            exact = np.asarray(self.vectors[np.sort(row)]) @ q_embs[qi]
+            top = np.argsort(-exact)[:k]
+            scores[qi, :len(top)] = exact[top]
+            idxs[qi, :len(top)] = np.sort(row)[top]
         return scores, idxs
+
+    def vectors_for(self, rows: List[int]) -> np.ndarray:
+        # float32 vectors for index rows (from the flat index, or the re-scoring store)
+        if self.vectors is not None:
+            return np.asarray(self.vectors[rows], dtype="float32")
+        return np.stack([self.index.reconstruct(int(r)) for r in rows]).astype("float32")
+
+    def quantization_report(self, k: int = 10, sample: int = 200) -> List[Dict[str, Any]]:
+        """
+        Recall@k of each quantization mode against exact float32 search, with index size,
+        using a sample of the corpus vectors as queries.
+        """
+        embs = np.ascontiguousarray(self.vectors if self.vectors is not None else self.index.reconstruct_n(0, self.index.ntotal), dtype="float32")
+        n = len(embs)
+        q = embs[np.random.RandomState(0).choice(n, size=min(sample, n), replace=False)]
+        k = min(k, n)
+        _, truth = _make_index(embs, "none").search(q, k)
+        rows = []
+        saved = (self.quantization, self.index, self.vectors)
+        try:
+            for mode in QUANTIZATIONS:
+                self.quantization, self.index, self.vectors = mode, _make_index(embs, mode), embs
+                _, got = self.search_vectors(q, k)
+                recall = float(np.mean([len(set(g) & set(t)) / k for g, t in zip(got.tolist(), truth.tolist())]))
+                rows.append({"quantization": mode, "recall_at_k": round(recall, 4), "k": k,
+                             "index_mb": round(_index_bytes(embs, mode) / 1e6, 3),
+                             "rescore_mb_on_disk": 0 if mode == "none" else round(embs.nbytes / 1e6, 3)})
+        finally:
+            self.quantization, self.index, self.vectors = saved
+        return rows
@@ -1,47 +1,297 @@
 from __future__ import annotations
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
+import time, json, asyncio, threading
+
+# Section generation budget: max_tokens, stop sequences, wall-clock deadline_s (None = unbounded).
+# `budget` on a backend is the config default (llm.default_budget); per-section overrides live in
+# advanced_analyzer.SECTIONS. Budgets apply only via BoundedLLM / generate_many; plain generate()
+# (entity extraction, digest) uses the backend's own `defaults`. stop=None leaves the backend's
+# own stop list: none for Ollama (a blank line would cut chat models after a heading),
+# "</s>" and a blank line for llama.cpp.
+DEFAULT_BUDGET: Dict[str, Any] = {"max_tokens": 1536, "stop": None, "deadline_s": None}
+LLAMA_CPP_STOP = ["</s>", "\n\n"]
 
 class LLMBase:
+    budget: Dict[str, Any] = DEFAULT_BUDGET
+    defaults: Dict[str, Any] = {}
+    thread_safe = True  # False = callers must not generate from several threads at once
+
     def generate(self, prompt: str) -> str:
+        return self.generate_bounded(prompt, **self.defaults)[0]
+
+    def generate_bounded(self, prompt: str, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+                         deadline_s: Optional[float] = None) -> Tuple[str, Optional[str]]:
+        """
+        Returns (text, cut) where cut is None when the model finished on its own,
+        "max_tokens" when the token budget ran out, or "deadline" when the wall-clock
+        deadline hit first (text is then the partial output streamed so far). The deadline
+        covers the whole request, including prompt evaluation before the first token.
+        """
         raise NotImplementedError
 
+class BoundedLLM(LLMBase):
+    """Applies one section's budget to an underlying backend and remembers how the last call ended."""
+    def __init__(self, llm: LLMBase, budget: Dict[str, Any]):
+        self.llm = llm
+        self.budget = budget
+        self.cut: Optional[str] = None
+
+    def generate(self, prompt: str) -> str:
+        text, self.cut = self.llm.generate_bounded(prompt, **self.budget)
+        return text
+
+    def generate_bounded(self, prompt: str, **budget) -> Tuple[str, Optional[str]]:
+        return self.llm.generate_bounded(prompt, **budget)
+
 class OllamaLLM(LLMBase):
-    def __init__(self, model: str, options: Optional[Dict[str, Any]] = None):
+    def __init__(self, model: str, options: Optional[Dict[str, Any]] = None, budget: Optional[Dict[str, Any]] = None,
+                 host: Optional[str] = None, timeout_s: float = 600.0):
         from ollama import Client
-        self.client = Client()
+        self.host = host
+        self.client = Client(host=host, timeout=timeout_s)
+        self._deadline_clients: Dict[float, Any] = {}  # one client per distinct deadline, reused
+        self._lock = threading.Lock()
         self.model = model
         self.options = options or {}
+        self.budget = {**DEFAULT_BUDGET, **(budget or {})}
 
-    def generate(self, prompt: str) -> str:
-        resp = self.client.generate(model=self.model, prompt=prompt, options=self.options)
-        return resp.get("response", "")
+    def _client_for(self, deadline_s: float):
+        # read timeout from the budget bounds the wait for the first token (prompt evaluation)
+        # and stalls between tokens; httpx timeouts are per client, hence a client per deadline
+        import httpx
+        from ollama import Client
+        with self._lock:
+            client = self._deadline_clients.get(deadline_s)
+            if client is None:
+                client = self._deadline_clients[deadline_s] = Client(
+                    host=self.host, timeout=httpx.Timeout(deadline_s, connect=min(10.0, deadline_s)))
+            return client
+
+    def close(self):
+        for client in [self.client, *self._deadline_clients.values()]:
+            client.close()
+        self._deadline_clients.clear()
+
+    def generate_bounded(self, prompt: str, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+                         deadline_s: Optional[float] = None) -> Tuple[str, Optional[str]]:
+        options = dict(self.options)
+        if max_tokens: options["num_predict"] = int(max_tokens)
+        if stop: options["stop"] = list(stop)
+        import httpx
+        end = time.monotonic() + deadline_s if deadline_s else None
+        # the loop below checks the overall deadline
+        client = self._client_for(deadline_s) if end else self.client
+        parts, cut = [], None
+        # streamed so the deadline can be checked between tokens; closing the stream aborts the request
+        stream = client.generate(model=self.model, prompt=prompt, options=options, stream=True)
+        try:
+            for chunk in stream:
+                parts.append(chunk.get("response", ""))
+                if chunk.get("done"):
+                    if chunk.get("done_reason") == "length":
+                        cut = "max_tokens"
+                    break
+                if end and time.monotonic() > end:
+                    cut = "deadline"
+                    break
+        except httpx.TimeoutException:
+            if not end:
+                raise
+            cut = "deadline"
+        finally:
+            stream.close()
+        return "".join(parts), cut
+
+class AsyncOllamaLLM(LLMBase):
+    """
+    asyncio-native Ollama client over httpx (POST /api/generate, streamed NDJSON) with a pooled
+    connection, explicit timeouts and model keep_alive. Use agenerate/agenerate_bounded from a
+    running loop; generate/generate_bounded/generate_many are a sync facade that submits to a
+    private loop thread, so threads and plain callers all share one pool. Cancelling a task (or
+    interrupting a sync call) closes its HTTP stream, which aborts generation server-side.
+    """
+    def __init__(self, model: str, options: Optional[Dict[str, Any]] = None, budget: Optional[Dict[str, Any]] = None,
+                 host: str = "http://localhost:11434", timeout_s: float = 600.0, connect_timeout_s: float = 10.0,
+                 max_connections: int = 8, max_keepalive_connections: int = 8, keepalive_expiry_s: float = 60.0,
+                 keep_alive: Optional[str] = "10m", max_concurrency: int = 4):
+        import httpx
+        self.model = model
+        self.options = options or {}
+        self.budget = {**DEFAULT_BUDGET, **(budget or {})}
+        self.keep_alive = keep_alive
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._client_args = dict(
+            base_url=host.rstrip("/"),
+            timeout=httpx.Timeout(timeout_s, connect=connect_timeout_s),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                                keepalive_expiry=keepalive_expiry_s),
+        )
+        self._clients: Dict[int, Any] = {}  # one AsyncClient per event loop; connections are loop-bound
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        import httpx
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(id(loop))
+        if client is None:
+            client = self._clients[id(loop)] = httpx.AsyncClient(**self._client_args)
+        return client
+
+    async def agenerate(self, prompt: str) -> str:
+        return (await self.agenerate_bounded(prompt, **self.defaults))[0]
+
+    async def agenerate_bounded(self, prompt: str, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+                                deadline_s: Optional[float] = None) -> Tuple[str, Optional[str]]:
+        options = dict(self.options)
+        if max_tokens: options["num_predict"] = int(max_tokens)
+        if stop: options["stop"] = list(stop)
+        body = {"model": self.model, "prompt": prompt, "options": options, "stream": True}
+        if self.keep_alive is not None:
+            body["keep_alive"] = self.keep_alive
+        parts: List[str] = []
+
+        async def run():
+            async with self._client().stream("POST", "/api/generate", json=body) as resp:
+                if resp.status_code >= 400:
+                    detail = (await resp.aread()).decode("utf-8", "ignore")[:500]
+                    raise RuntimeError(f"Ollama /api/generate returned {resp.status_code}: {detail}")
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(f"Ollama error: {chunk['error']}")
+                    parts.append(chunk.get("response", ""))
+                    if chunk.get("done"):
+                        return "max_tokens" if chunk.get("done_reason") == "length" else None
+            return None
+
+        if not deadline_s:
+            cut = await run()
+        else:
+            # the whole request is bounded, time-to-first-token included; on expiry the stream is
+            # cancelled (closing the connection aborts generation) and the parts so far are kept
+            try:
+                cut = await asyncio.wait_for(run(), timeout=deadline_s)
+            except asyncio.TimeoutError:
+                cut = "deadline"
+        return "".join(parts), cut
+
+    async def agenerate_many(self, jobs: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Optional[str]]]:
+        """(prompt, budget) jobs run concurrently (at most max_concurrency in flight); results keep job order."""
+        sem = asyncio.Semaphore(self.max_concurrency)
+        async def one(prompt, budget):
+            async with sem:
+                return await self.agenerate_bounded(prompt, **budget)
+        return await asyncio.gather(*(one(p, b) for p, b in jobs))
+
+    def _run(self, coro):
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="ollama-async", daemon=True).start()
+        fut = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return fut.result()
+        except BaseException:
+            fut.cancel()  # e.g. KeyboardInterrupt: cancel the request instead of leaving it streaming
+            raise
+
+    def generate_bounded(self, prompt: str, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+                         deadline_s: Optional[float] = None) -> Tuple[str, Optional[str]]:
+        return self._run(self.agenerate_bounded(prompt, max_tokens=max_tokens, stop=stop, deadline_s=deadline_s))
+
+    def generate_many(self, jobs: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Optional[str]]]:
+        return self._run(self.agenerate_many(jobs))
+
+    async def aclose(self):
+        client = self._clients.pop(id(asyncio.get_running_loop()), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._run(self.aclose())
+        # finalize stream generators left open by cancelled/deadline-cut requests
+        self._run(self._loop.shutdown_asyncgens())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
 
 class LlamaCppLLM(LLMBase):
-    def __init__(self, model_path: str, n_ctx: int = 8192, n_threads: int = 8, temperature: float = 0.1, top_p: float = 0.9):
+    defaults = {"max_tokens": 1536, "stop": LLAMA_CPP_STOP}
+    thread_safe = False  # one Llama context; concurrent calls corrupt its state
+
+    def __init__(self, model_path: str, n_ctx: int = 8192, n_threads: int = 8, temperature: float = 0.1, top_p: float = 0.9,
+                 budget: Optional[Dict[str, Any]] = None):
         from llama_cpp import Llama
         self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads)
         self.temperature = float(temperature)
         self.top_p = float(top_p)
+        self.budget = {**DEFAULT_BUDGET, "stop": LLAMA_CPP_STOP, **{k: v for k, v in (budget or {}).items() if v is not None}}
 
-    def generate(self, prompt: str) -> str:
-        out = self.llm.create_completion(
+    def _prefill(self, prompt: str, end: float) -> bool:
+        """
+        Evaluate the prompt in n_batch slices, checking the deadline between slices, so prompt
+        evaluation is bounded too (llama.cpp has no hook inside create_completion for it).
+        create_completion then reuses the evaluated prefix. False = deadline hit first.
+        """
+        tokens = self.llm.tokenize(prompt.encode("utf-8"), special=True)
+        if len(tokens) >= self.llm.n_ctx():
+            return True  # let create_completion raise its context-length error
+        self.llm.reset()
+        step = max(1, self.llm.n_batch)
+        # the last token is left for create_completion, which needs one to sample from
+        for i in range(0, len(tokens) - 1, step):
+            if time.monotonic() > end:
+                return False
+            self.llm.eval(tokens[i:min(i + step, len(tokens) - 1)])
+        return time.monotonic() <= end
+
+    def generate_bounded(self, prompt: str, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None,
+                         deadline_s: Optional[float] = None) -> Tuple[str, Optional[str]]:
+        end = time.monotonic() + deadline_s if deadline_s else None
+        if end and not self._prefill(prompt, end):
+            return "", "deadline"
+        parts, cut = [], None
+        stream = self.llm.create_completion(
             prompt=prompt,
-            max_tokens=1536,
+            max_tokens=int(max_tokens) if max_tokens else -1,
             temperature=self.temperature,
             top_p=self.top_p,
-            stop=["</s>", "\n\n"]
+            stop=list(stop or []),
+            stream=True,
         )
-        return out["choices"][0]["text"] if out.get("choices") else ""
+        try:
+            for chunk in stream:
+                choice = chunk["choices"][0] if chunk.get("choices") else {}
+                parts.append(choice.get("text", ""))
+                if choice.get("finish_reason"):
+                    if choice["finish_reason"] == "length":
+                        cut = "max_tokens"
+                    break
+                if end and time.monotonic() > end:
+                    cut = "deadline"
+                    break
+        finally:
+            stream.close()
+        return "".join(parts), cut
 
 def build_llm(cfg: dict) -> LLMBase:
     backend = cfg["llm"]["backend"]
+    budget = cfg["llm"].get("default_budget")
     if backend == "ollama":
         model = cfg["llm"]["ollama"]["model"]
         options = cfg["llm"]["ollama"].get("options", {})
-        return OllamaLLM(model=model, options=options)
+        http = cfg["llm"]["ollama"].get("http", {})
+        return OllamaLLM(model=model, options=options, budget=budget, host=http.get("host"), timeout_s=http.get("timeout_s", 600.0))
+    elif backend == "ollama_async":
+        oc = cfg["llm"]["ollama"]
+        return AsyncOllamaLLM(model=oc["model"], options=oc.get("options", {}), budget=budget, **oc.get("http", {}))
     elif backend == "llama_cpp":
         lc = cfg["llm"]["llama_cpp"]
-        return LlamaCppLLM(model_path=lc["model_path"], n_ctx=lc["n_ctx"], n_threads=lc["n_threads"], temperature=lc["temperature"], top_p=lc["top_p"])
+        return LlamaCppLLM(model_path=lc["model_path"], n_ctx=lc["n_ctx"], n_threads=lc["n_threads"], temperature=lc["temperature"], top_p=lc["top_p"], budget=budget)
     else:
         raise ValueError(f"Unsupported LLM backend: {backend}")
 
@@ -1,17 +1,110 @@
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
-def get_logger(log_path: str) -> logging.Logger:
+_listener = None
+
+class JsonLineFormatter(logging.Formatter):
+    # one JSON object per line; pass structured fields via extra={"fields": {...}}
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, dict):
+            out.update(fields)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, default=str)
+
+class TextFormatter(logging.Formatter):
+    # classic "ts | level | msg" line, with structured fields appended as JSON
+    def __init__(self):
+        super().__init__("%(asctime)s | %(levelname)s | %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, dict):
+            line += " | " + json.dumps(fields, default=str)
+        return line
+
+class _RecordQueueHandler(QueueHandler):
+    # stock prepare() runs self.format() on the caller and drops exc_info/exc_text, so the
+    # listener's formatter never sees the traceback; only merge args and render the traceback here
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None  # tracebacks don't pickle and pin frames; exc_text carries it
+        return record
+
+class DebugSampler(logging.Filter):
+    # keep every INFO+ record, but only a fraction of high-volume DEBUG events
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+def stop_logging():
+    # flush and join the background listener; safe to call more than once
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def get_logger(
+    log_path: str,
+    queued: bool = False,
+    json_lines: bool = False,
+    level: str = "INFO",
+    debug_sample_rate: float = 1.0,
+) -> logging.Logger:
+    """
+    queued=True moves formatting and stream/file I/O (incl. rotation) to a background
+    QueueListener thread; worker threads only merge the message args (and render a
+    traceback, if any) before the enqueue.
+    """
+    global _listener
     logger = logging.getLogger("cpa")
     if logger.handlers:
         return logger
-    logger.setLevel(logging.INFO)
-    fmt = logging.Formatter("%(asctime)s | %(levelname)s | %(message)s")
+    logger.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    fmt = JsonLineFormatter() if json_lines else TextFormatter()
+    handlers = []
     ch = logging.StreamHandler()
     ch.setFormatter(fmt)
-    logger.addHandler(ch)
+    handlers.append(ch)
     if log_path:
         fh = RotatingFileHandler(log_path, maxBytes=2_000_000, backupCount=3)
         fh.setFormatter(fmt)
-        logger.addHandler(fh)
+        handlers.append(fh)
+    sampler = DebugSampler(debug_sample_rate)
+    if queued:
+        qh = _RecordQueueHandler(queue.SimpleQueue())
+        qh.addFilter(sampler)  # drop sampled-out events before they are enqueued
+        logger.addHandler(qh)
+        _listener = QueueListener(qh.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+    else:
+        for h in handlers:
+            h.addFilter(sampler)
+            logger.addHandler(h)
     return logger
@@ -0,0 +1,117 @@
+# modules/memory.py
+from __future__ import annotations
+from typing import Dict, Any, Optional, List
+import os, sys, gc, time, threading
+
+# Resident-memory accounting for the low-memory mode: current RSS, per-stage peak RSS and a
+# configurable ceiling. Linux reads /proc (and resets the kernel's high-water mark per stage);
+# elsewhere psutil is used if installed, with a sampling thread catching peaks between checks.
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except Exception:
+        import resource  # peak, not current, but the best available without psutil
+        r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return r / 2**20 if sys.platform == "darwin" else r / 1024
+
+def _hwm_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _reset_hwm() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # resets VmHWM to the current RSS
+        return True
+    except OSError:
+        return False
+
+class MemoryMonitor:
+    """
+    Tracks peak RSS per named stage: begin("x") closes the previous stage and opens the next,
+    end() closes the last. With ceiling_mb set, check() (called at stage ends and from streaming
+    loops) first runs gc, then logs once per stage or, with hard=True, raises MemoryError when
+    RSS is still above the ceiling.
+    """
+    def __init__(self, ceiling_mb: Optional[float] = None, hard: bool = False, log: Optional[Any] = None, interval_s: float = 0.05):
+        self.ceiling_mb = ceiling_mb
+        self.hard = hard
+        self.log = log
+        self.interval_s = interval_s
+        self.stages: List[Dict[str, Any]] = []
+        self._stage: Optional[str] = None
+        self._start = 0.0
+        self._t0 = 0.0
+        self._peak = 0.0
+        self._hwm = False
+        self._warned = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval_s):
+            self._peak = max(self._peak, rss_mb())
+
+    def begin(self, name: str):
+        self.end()
+        self._stage = name
+        self._hwm = _reset_hwm()
+        self._start = self._peak = rss_mb()
+        self._t0 = time.perf_counter()
+        if not self._hwm and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+            self._thread.start()
+
+    def end(self):
+        if self._stage is None:
+            return
+        gc.collect()  # release intermediates dropped during the stage before measuring its end state
+        end = rss_mb()
+        peak = max(self._peak, end, (_hwm_mb() or 0.0) if self._hwm else 0.0)
+        row = {"stage": self._stage, "start_mb": round(self._start, 1), "peak_mb": round(peak, 1), "end_mb": round(end, 1),
+               "seconds": round(time.perf_counter() - self._t0, 3)}
+        self.stages.append(row)
+        if self.log:
+            self.log.info("Memory", extra={"fields": row})
+        self.check()
+        self._stage = None
+
+    def check(self):
+        rss = rss_mb()
+        self._peak = max(self._peak, rss)
+        if not self.ceiling_mb or rss <= self.ceiling_mb:
+            return
+        gc.collect()
+        rss = rss_mb()
+        if rss <= self.ceiling_mb:
+            return
+        msg = f"RSS {rss:.0f} MB exceeds the {self.ceiling_mb:.0f} MB ceiling during '{self._stage}'"
+        if self.hard:
+            raise MemoryError(msg)
+        if self._stage not in self._warned and self.log:
+            self._warned.add(self._stage)
+            self.log.warning(msg)
+
+    def close(self):
+        self.end()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        if self.log and self.stages:
+            top = max(self.stages, key=lambda r: r["peak_mb"])
+            self.log.info(f"Peak RSS {top['peak_mb']:.0f} MB during '{top['stage']}'")
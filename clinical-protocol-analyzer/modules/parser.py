@@ -1,26 +1,41 @@
 from __future__ import annotations
 import os, re
 import fitz  # PyMuPDF
+from typing import List, Iterator, Iterable
 from docx import Document as DocxDocument
 
 def load_text(path: str) -> str:
+    return "\n".join(load_pages(path))
+
+def load_pages(path: str) -> List[str]:
+    # One entry per PDF page; DOCX/TXT have no page structure and come back as a single entry
     ext = os.path.splitext(path)[1].lower()
     if ext in [".txt", ".md"]:
         with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
+            return [f.read()]
     if ext == ".pdf":
-        return _read_pdf(path)
+        return _read_pdf_pages(path)
     if ext == ".docx":
-        return _read_docx(path)
+        return [_read_docx(path)]
     raise ValueError(f"Unsupported file type: {ext}. Use PDF, DOCX, or TXT.")
 
 def _read_pdf(path: str) -> str:
+    return "\n".join(_read_pdf_pages(path))
+
+def _read_pdf_pages(path: str) -> List[str]:
+    return list(iter_pages(path))
+
+def iter_pages(path: str) -> Iterator[str]:
+    # like load_pages, but PDF pages are read one at a time (low-memory mode)
+    if os.path.splitext(path)[1].lower() != ".pdf":
+        yield from load_pages(path)
+        return
     doc = fitz.open(path)
-    texts = []
-    for page in doc:
-        texts.append(page.get_text("text"))
-    doc.close()
-    return "\n".join(texts)
+    try:
+        for page in doc:
+            yield page.get_text("text")
+    finally:
+        doc.close()
 
 def _read_docx(path: str) -> str:
     doc = DocxDocument(path)
@@ -31,3 +46,21 @@ def clean_text(text: str) -> str:
     text = re.sub(r"\n{3,}", "\n\n", text)
     text = re.sub(r"(\w+)-\n(\w+)", r"\1\2", text)
     return text
+
+def iter_clean(pages: Iterable[str]) -> Iterator[str]:
+    """
+    clean_text over a page stream. A page's last line is held back until the next page
+    arrives, so hyphenation and blank-line runs across page joins clean as in the joined text.
+    """
+    carry = ""
+    for p in pages:
+        text = clean_text(carry + p + "\n")
+        cut = text.rfind("\n", 0, len(text) - 1) + 1
+        # keep trailing newlines with the carry so "\n{3,}" still sees the whole run
+        while cut > 0 and text[cut - 1] == "\n":
+            cut -= 1
+        carry = text[cut:]
+        if text[:cut]:
+            yield text[:cut]
+    if carry:
+        yield clean_text(carry)
@@ -0,0 +1,82 @@
+# modules/precedents.py
+from __future__ import annotations
+from typing import List, Dict, Any, Optional, Union
+import numpy as np
+import pandas as pd
+from .ctgov import studies_frame, ctgov_listing
+
+# Precedent analytics over CTGov studies: numbers the section prompts can cite instead of
+# asking the LLM to infer enrollment, durations or site counts from raw listings.
+
+def precedent_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    """Per-study numeric columns (vectorized): enrollment, duration, sites, rates."""
+    start = pd.to_datetime(df.get("startDate"), errors="coerce", format="mixed")
+    end = pd.to_datetime(df.get("completionDate"), errors="coerce", format="mixed")
+    months = (end - start).dt.days / 30.44
+    months = months.where(months > 0)
+    enroll = pd.to_numeric(df.get("enrollmentCount"), errors="coerce").astype("float64")
+    sites = pd.to_numeric(df.get("siteCount"), errors="coerce").astype("float64")
+    per_site = enroll / sites.where(sites > 0)
+    return pd.DataFrame({
+        "enrollment": enroll,
+        "duration_months": months,
+        "sites": sites,
+        "enrollment_per_site": per_site,
+        "pts_per_site_month": per_site / months,
+    }, index=df.index)
+
+def summary_table(metrics: pd.DataFrame) -> pd.DataFrame:
+    rows = {}
+    for col in metrics.columns:
+        v = metrics[col].to_numpy(dtype="float64")
+        v = v[np.isfinite(v)]
+        if not len(v):
+            rows[col] = {"n": 0}
+            continue
+        p25, med, p75 = np.percentile(v, [25, 50, 75])
+        rows[col] = {"n": len(v), "median": med, "p25": p25, "p75": p75, "min": v.min(), "max": v.max()}
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+def _distribution(s: pd.Series, top: int = 6, total: Optional[int] = None) -> str:
+    # total = denominator for the shares; pass the study count for multi-valued columns
+    counts = s.value_counts()
+    total = int(counts.sum()) if total is None else total
+    if not total or counts.empty:
+        return "n/a"
+    return ", ".join(f"{k} {v} ({100 * v / total:.0f}%)" for k, v in counts.head(top).items())
+
+def _per_study(col: pd.Series) -> pd.Series:
+    # "A|B" cells -> one row per distinct non-empty value per study
+    s = col.fillna("").astype(str).str.split("|").explode()
+    s = s[s.astype(bool)]
+    return s[~s.reset_index().duplicated().values]
+
+def render_precedents(ctlist: Union[str, pd.DataFrame, List[Dict[str, Any]]], listing_n: int = 10) -> str:
+    """
+    Compact, computed precedent context for prompts: metric table, phase/status/country
+    distributions, plus a short listing so [CTGov NCT..] citations remain possible.
+    """
+    if isinstance(ctlist, str):
+        return ctlist
+    df = ctlist if isinstance(ctlist, pd.DataFrame) else studies_frame(ctlist or [])
+    if df.empty:
+        return "No CTGov precedents found."
+    table = summary_table(precedent_metrics(df))
+    lines = [f"Computed over {len(df)} CTGov studies (values are computed, not estimated).",
+             "metric\tn\tmedian\tp25\tp75\tmin\tmax"]
+    for name, r in table.iterrows():
+        if not r.get("n"):
+            lines.append(f"{name}\t0\t-\t-\t-\t-\t-")
+            continue
+        lines.append(f"{name}\t{int(r['n'])}\t" + "\t".join(f"{r[c]:.2f}" for c in ["median", "p25", "p75", "min", "max"]))
+    # multi-valued columns: each study counts once per value, shares are of studies
+    phases = _per_study(df["phases"])
+    lines.append("phase distribution (studies): " + _distribution(phases, total=len(df)))
+    lines.append("status distribution: " + _distribution(df["overallStatus"].astype(object).dropna()))
+    if "countries" in df:
+        lines.append("top countries (studies): " + _distribution(_per_study(df["countries"]), top=8, total=len(df)))
+    if "enrollmentCount" in df:
+        df = df.assign(_e=pd.to_numeric(df["enrollmentCount"], errors="coerce")).sort_values("_e", ascending=False, na_position="last")
+    lines.append("largest precedents:")
+    lines.append(ctgov_listing(df.drop(columns=["_e"], errors="ignore"), maxn=listing_n))
+    return "\n".join(lines)
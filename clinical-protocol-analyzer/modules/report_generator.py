@@ -1,20 +1,109 @@
 # modules/report_generator.py
 from __future__ import annotations
-from typing import Dict, Any
+from typing import Dict, Any, List
+from functools import lru_cache
+import re
 from reportlab.lib.pagesizes import LETTER
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfgen import canvas
 
+# heading level -> (font, size, leading)
+_HEADINGS = {1: ("Helvetica-Bold", 16, 22), 2: ("Helvetica-Bold", 13, 18), 3: ("Helvetica-Bold", 11, 16)}
+_BODY = ("Helvetica", 10, 14)
+
 def to_markdown(narrative_md: str) -> str:
     return narrative_md
 
-def md_to_pdf(md_text: str, pdf_path: str):
-    c = canvas.Canvas(pdf_path, pagesize=LETTER)
-    width, height = LETTER
-    y = height - 50
-    for line in md_text.splitlines():
-        if y < 50:
-            c.showPage(); y = height - 50
-        c.drawString(50, y, line[:120])
-        y -= 14
-    c.save()
+def split_sections(md_text: str) -> Dict[str, str]:
+    # inverse of main.run_advanced_analysis: every section is "# <title>" followed by its body
+    parts = re.split(r"^# (.+)$", md_text, flags=re.M)
+    return {parts[i].strip(): parts[i + 1].strip() for i in range(1, len(parts) - 1, 2)}
+
+@lru_cache(maxsize=65536)
+def _width(word: str, font: str, size: float) -> float:
+    return stringWidth(word, font, size)
+
+def _split_long(word: str, font: str, size: float, max_w: float) -> List[str]:
+    parts, buf = [], ""
+    for ch in word:
+        if buf and _width(buf + ch, font, size) > max_w:
+            parts.append(buf); buf = ""
+        buf += ch
+    return parts + ([buf] if buf else [])
+
+def wrap_text(text: str, font: str, size: float, max_w: float) -> List[str]:
+    """Greedy word wrap using cached per-word metrics (linear in text length)."""
+    space = _width(" ", font, size)
+    lines, cur, cur_w = [], [], 0.0
+    for word in text.split():
+        w = _width(word, font, size)
+        if w > max_w:
+            if cur:
+                lines.append(" ".join(cur)); cur, cur_w = [], 0.0
+            pieces = _split_long(word, font, size, max_w)
+            lines.extend(pieces[:-1])
+            word = pieces[-1]; w = _width(word, font, size)
+        add = w if not cur else space + w
+        if cur and cur_w + add > max_w:
+            lines.append(" ".join(cur)); cur, cur_w = [word], w
+        else:
+            cur.append(word); cur_w += add
+    if cur:
+        lines.append(" ".join(cur))
+    return lines
+
+class PdfReportWriter:
+    """
+    Incremental Markdown -> PDF renderer. Call add_markdown() as each section finishes,
+    then close(). Wrapping and drawing happen per section, so work per section is independent
+    of how much has already been rendered; reportlab's Canvas still keeps every finished page
+    until save(), so memory grows with the page count (pageCompression keeps each page small).
+    """
+    def __init__(self, pdf_path: str, pagesize=LETTER, margin: float = 50):
+        self.c = canvas.Canvas(pdf_path, pagesize=pagesize, pageCompression=1)
+        self.width, self.height = pagesize
+        self.margin = margin
+        self.max_w = self.width - 2 * margin
+        self.y = self.height - margin
 
+    def _line(self, text: str, font: str, size: float, leading: float, x: float):
+        if self.y - leading < self.margin:
+            self.c.showPage(); self.y = self.height - self.margin
+        self.y -= leading
+        self.c.setFont(font, size)
+        self.c.drawString(x, self.y, text)
+
+    def add_markdown(self, md_text: str):
+        for raw in md_text.splitlines():
+            line = raw.rstrip()
+            if not line.strip():
+                self.y -= _BODY[2] / 2
+                continue
+            m = re.match(r"^(#{1,6})\s+(.*)", line)
+            if m:
+                font, size, leading = _HEADINGS.get(len(m.group(1)), _HEADINGS[3])
+                text, indent, hang = m.group(2), 0.0, 0.0
+                self.y -= leading / 3
+            else:
+                font, size, leading = _BODY
+                b = re.match(r"^(\s*)([-*+]|\d+[.)])\s+(.*)", line)
+                if b:
+                    indent = 12 + 6 * len(b.group(1))
+                    text = f"{'•' if b.group(2) in '-*+' else b.group(2)} {b.group(3)}"
+                    hang = 10
+                else:
+                    text, indent, hang = line.strip(), 0.0, 0.0
+            text = re.sub(r"(\*\*|__|`)", "", text)
+            for i, ln in enumerate(wrap_text(text, font, size, self.max_w - indent - hang)):
+                self._line(ln, font, size, leading, self.margin + indent + (hang if i else 0))
+
+    def add_section(self, title: str, body: str):
+        self.add_markdown(f"# {title}\n{body}\n")
+
+    def close(self):
+        self.c.save()
+
+def md_to_pdf(md_text: str, pdf_path: str):
+    w = PdfReportWriter(pdf_path)
+    w.add_markdown(md_text)
+    w.close()
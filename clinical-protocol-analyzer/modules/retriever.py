@@ -1,26 +1,91 @@
 from __future__ import annotations
-from typing import List, Dict
+from typing import List, Dict, Optional
+from collections import OrderedDict
+import numpy as np
 from .embeddings import VectorIndex
 
 class Retriever:
-    def __init__(self, index: VectorIndex, chunks: List[Dict]):
+    def __init__(self, index: VectorIndex, chunks: List[Dict], query_cache_size: int = 512):
         self.index = index
         self.chunks = chunks
+        self.query_cache_size = query_cache_size
+        self._qcache: "OrderedDict[str, np.ndarray]" = OrderedDict()  # query -> normalized embedding (LRU)
 
     @classmethod
-    def build(cls, chunks: List[Dict], index_path: str, emb_model: str, batch_size: int = 64, device: str = "cpu"):
+    def build(cls, chunks: List[Dict], index_path: str, emb_model: str, batch_size: int = 64, device: str = "cpu",
+              token_budget: Optional[int] = None, workers: int = 1, quantization: str = "none", rescore_factor: int = 4,
+              spill: bool = False):
         texts = [c["text"] for c in chunks]
-        index = VectorIndex(model_name=emb_model, index_path=index_path, batch_size=batch_size, device=device)
-        index.build(texts)
+        index = VectorIndex(model_name=emb_model, index_path=index_path, batch_size=batch_size, device=device,
+                            token_budget=token_budget, workers=workers, quantization=quantization, rescore_factor=rescore_factor,
+                            spill=spill)
+        index.build(texts, ids=[c["id"] for c in chunks])
         return cls(index=index, chunks=chunks)
 
     @classmethod
-    def load(cls, chunks: List[Dict], index_path: str, emb_model: str, batch_size: int = 64, device: str = "cpu"):
-        index = VectorIndex(model_name=emb_model, index_path=index_path, batch_size=batch_size, device=device)
+    def load(cls, chunks: List[Dict], index_path: str, emb_model: str, batch_size: int = 64, device: str = "cpu",
+             quantization: str = "none", rescore_factor: int = 4):
+        index = VectorIndex(model_name=emb_model, index_path=index_path, batch_size=batch_size, device=device,
+                            quantization=quantization, rescore_factor=rescore_factor)
         index.load()
         return cls(index=index, chunks=chunks)
 
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        # one encode call for all queries not already in the LRU cache
+        missing = list(dict.fromkeys(q for q in queries if q not in self._qcache))
+        fresh = dict(zip(missing, self.index.embed_queries(missing))) if missing else {}
+        # read results before trimming: a batch may hold more unique queries than the cache
+        out = np.ascontiguousarray(np.stack([fresh[q] if q in fresh else self._qcache[q] for q in queries]), dtype="float32")
+        for q in queries:
+            if q in fresh:
+                self._qcache[q] = fresh[q]
+            self._qcache.move_to_end(q)
+        while len(self._qcache) > self.query_cache_size:
+            self._qcache.popitem(last=False)
+        return out
+
     def retrieve(self, query: str, k: int = 8) -> List[Dict]:
-        _, idxs = self.index.search([query], k=k)
-        hits = idxs[0].tolist()
-        return [self.chunks[i] for i in hits]
+        _, idxs = self.index.search_vectors(self._embed_queries([query]), k=k)
+        # faiss pads with -1 when k exceeds the index size
+        return [self.chunks[i] for i in idxs[0].tolist() if i >= 0]
+
+    def retrieve_many(self, queries: List[str], k: int = 8, mmr: bool = False, mmr_lambda: float = 0.7, fetch_factor: int = 3) -> List[Dict]:
+        """
+        Embed all queries in one batch, run a single index search, merge hits across queries
+        (best score per chunk) and return the top k as {"chunk", "score", "queries"} dicts.
+        With mmr=True the merged pool is re-ranked by maximal marginal relevance for diversity.
+        """
+        if not queries:
+            return []
+        q_embs = self._embed_queries(queries)
+        per_query = k * fetch_factor if mmr else k
+        scores, idxs = self.index.search_vectors(q_embs, k=per_query)
+        best: Dict[int, Dict] = {}
+        for qi, (srow, irow) in enumerate(zip(scores.tolist(), idxs.tolist())):
+            for s, i in zip(srow, irow):
+                if i < 0:
+                    continue
+                hit = best.get(i)
+                if hit is None:
+                    best[i] = {"row": i, "score": float(s), "queries": [qi]}
+                else:
+                    hit["queries"].append(qi)
+                    hit["score"] = max(hit["score"], float(s))
+        pool = sorted(best.values(), key=lambda h: -h["score"])
+        if mmr and len(pool) > k:
+            pool = self._mmr(pool, k, mmr_lambda)
+        return [{"chunk": self.chunks[h["row"]], "score": h["score"], "queries": h["queries"]} for h in pool[:k]]
+
+    def _mmr(self, pool: List[Dict], k: int, lam: float) -> List[Dict]:
+        vecs = self.index.vectors_for([h["row"] for h in pool])
+        rel = np.array([h["score"] for h in pool], dtype="float32")
+        sim = vecs @ vecs.T
+        chosen = [0]
+        max_sim = sim[0].copy()
+        while len(chosen) < k:
+            gain = lam * rel - (1 - lam) * max_sim
+            gain[chosen] = -np.inf
+            j = int(np.argmax(gain))
+            chosen.append(j)
+            max_sim = np.maximum(max_sim, sim[j])
+        return [pool[j] for j in chosen]
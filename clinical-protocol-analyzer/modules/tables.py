@@ -0,0 +1,165 @@
+# modules/tables.py
+from __future__ import annotations
+from typing import List, Dict, Tuple, Optional, Iterator
+import os, re, json
+import fitz  # PyMuPDF
+
+# Structured tables (schedule of assessments, lab thresholds, eligibility grids) pulled out of
+# PDF pages with PyMuPDF's table finder. get_text("text") flattens these into interleaved
+# cells; here they are kept as rows/columns with page refs and rendered as compact TSV.
+
+TABLE_KINDS: Dict[str, List[str]] = {
+    "schedule": ["visit", "screening", "baseline", "day", "week", "schedule", "assessment", "follow-up", "end of treatment", "window"],
+    "labs": ["laboratory", "lab", "labs", "uln", "hemoglobin", "creatinine", "alt", "ast", "bilirubin", "platelet", "neutrophil", "egfr", "mg/dl", "g/dl", "x 10",
+             "chemistry", "hematology", "haematology", "coagulation", "urinalysis"],
+    "eligibility": ["inclusion", "exclusion", "criteria", "criterion", "eligible", "eligibility"],
+}
+
+def _word_re(w: str) -> re.Pattern:
+    # whole words only: "alt" must not match "ALT-100" / "ALT\u2011100" (a drug code) nor "day" "today"
+    return re.compile(r"(?<![\w\-\u2010-\u2015])" + re.escape(w) + r"(?![\w\-\u2010-\u2015])", re.I)
+
+_KIND_RES = {k: [_word_re(w) for w in kws] for k, kws in TABLE_KINDS.items()}
+# ask words that say what to do, not what about; they match any table
+_GENERIC = {"with", "from", "that", "into", "over", "each", "including", "include", "quantify", "estimate", "impact", "based",
+            "using", "plan", "propose", "define", "recommend", "provide", "align", "expected", "likely", "effects", "without"}
+_LABEL_CHARS = 80  # header / first-column cells longer than this are prose, weighted as body
+
+def _cell(v) -> str:
+    return re.sub(r"\s+", " ", str(v)).strip() if v is not None else ""
+
+def _regions(header: List[str], rows: List[List[str]], body_rows: Optional[int] = None) -> Tuple[str, str, str]:
+    # (header, row labels, body): short header/first-column cells identify a table; long ones are body
+    labels = [r[0] for r in rows if r]
+    head = [h for h in header if len(h) <= _LABEL_CHARS]
+    first = [c for c in labels if len(c) <= _LABEL_CHARS]
+    body_part = rows if body_rows is None else rows[:body_rows]
+    body = [h for h in header if len(h) > _LABEL_CHARS] + [r[0] for r in body_part if r and len(r[0]) > _LABEL_CHARS]
+    body += [c for r in body_part for c in r[1:]]
+    return " ".join(head), " ".join(first), " ".join(body)
+
+def _weighted_hits(regions: Tuple[str, str, str], pats: List[re.Pattern]) -> int:
+    head, first, body = regions
+    return sum(3 * len(p.findall(head)) + 2 * len(p.findall(first)) + len(p.findall(body)) for p in pats)
+
+def _classify(header: List[str], rows: List[List[str]]) -> str:
+    regions = _regions(header, rows, body_rows=2)
+    scores = {k: _weighted_hits(regions, pats) for k, pats in _KIND_RES.items()}
+    kind, best = max(scores.items(), key=lambda kv: kv[1])
+    return kind if best >= 3 else "other"  # one stray body word is not a lab/schedule table
+
+def _drop_empty(header: List[str], rows: List[List[str]]) -> Tuple[List[str], List[List[str]]]:
+    rows = [r for r in rows if any(r)]
+    keep = [j for j in range(len(header)) if header[j] or any(j < len(r) and r[j] for r in rows)]
+    return [header[j] for j in keep], [[r[j] if j < len(r) else "" for j in keep] for r in rows]
+
+def _page_tables(page, min_rows: int, min_cols: int) -> List[dict]:
+    out = []
+    for t in page.find_tables().tables:
+        data = [[_cell(c) for c in row] for row in t.extract()]
+        header = [_cell(n) for n in t.header.names]
+        if not t.header.external and data and data[0] == header:
+            data = data[1:]  # header row is part of the cell grid
+        # generated names ("Col1") carry no information
+        header = ["" if re.fullmatch(r"Col\d+", h) else h for h in header]
+        header, rows = _drop_empty(header, data)
+        if len(rows) < min_rows or len(header) < min_cols:
+            continue
+        out.append({"bbox": list(t.bbox), "header": header, "rows": rows, "flat_chars": len(page.get_text("text", clip=t.bbox))})
+    return out
+
+def _text_outside(page, rects: List[fitz.Rect], placeholders: List[str]) -> str:
+    # page text minus blocks that sit inside a table; each table leaves a one-line placeholder
+    parts, placed = [], set()
+    for b in page.get_text("blocks", sort=True):
+        r = fitz.Rect(b[:4])
+        hit = next((i for i, tr in enumerate(rects) if r.intersect(tr).get_area() >= 0.5 * max(r.get_area(), 1e-6)), None)
+        if hit is None:
+            parts.append(b[4])
+        elif hit not in placed:
+            placed.add(hit)
+            parts.append(placeholders[hit] + "\n")
+    for i in range(len(rects)):
+        if i not in placed:
+            parts.append(placeholders[i] + "\n")
+    return "".join(parts)
+
+def extract_pdf(path: str, strip: bool = True, min_rows: int = 2, min_cols: int = 2) -> Tuple[List[str], List[dict]]:
+    """
+    Returns (pages, tables). Tables are dicts {id, kind, pages, header, rows, flat_chars}; a table
+    continuing onto the next page with the same header is merged. With strip=True the table
+    regions are replaced in the page text by "[Table T<n> ...]" so chunks don't carry the flattened cells.
+    """
+    tables: List[dict] = []
+    pages = list(iter_pdf(path, tables, strip=strip, min_rows=min_rows, min_cols=min_cols))
+    return pages, tables
+
+def iter_pdf(path: str, tables: List[dict], strip: bool = True, min_rows: int = 2, min_cols: int = 2) -> Iterator[str]:
+    # streaming form of extract_pdf: yields page text, appends tables to `tables` as they are found
+    doc = fitz.open(path)
+    try:
+        for pno, page in enumerate(doc, start=1):
+            found = _page_tables(page, min_rows, min_cols)
+            placeholders = []
+            for i, t in enumerate(found):
+                prev = tables[-1] if tables else None
+                if i == 0 and prev and prev["pages"][-1] == pno - 1 and prev["header"] == t["header"]:
+                    prev["rows"].extend(t["rows"])
+                    prev["flat_chars"] += t["flat_chars"]
+                    prev["pages"].append(pno)
+                else:
+                    tables.append({"id": f"T{len(tables) + 1}", "pages": [pno], "header": t["header"], "rows": t["rows"], "flat_chars": t["flat_chars"]})
+                placeholders.append(f"[Table {tables[-1]['id']} (p.{pno}): extracted separately]")
+                tables[-1]["kind"] = _classify(tables[-1]["header"], tables[-1]["rows"])
+            if strip and found:
+                yield _text_outside(page, [fitz.Rect(t["bbox"]) for t in found], placeholders)
+            else:
+                yield page.get_text("text")
+    finally:
+        doc.close()
+
+def table_tsv(table: dict, max_rows: Optional[int] = None) -> str:
+    rows = table["rows"] if max_rows is None else table["rows"][:max_rows]
+    lines = ["\t".join(table["header"])] if any(table["header"]) else []
+    lines += ["\t".join(r) for r in rows]
+    if max_rows is not None and len(table["rows"]) > max_rows:
+        lines.append(f"... {len(table['rows']) - max_rows} more rows")
+    return "\n".join(lines)
+
+def table_label(table: dict) -> str:
+    p = table["pages"]
+    pages = f"p.{p[0]}" if len(p) == 1 else f"p.{p[0]}-{p[-1]}"
+    return f"{table['kind']} table, {pages}"
+
+def select_tables(tables: List[dict], focus: str, n: int = 2, max_chars: int = 6000) -> List[dict]:
+    """
+    Tables most relevant to a section's ask, as prompt sources {id, text} (TSV, truncated to
+    max_chars). Whole-word matches of the ask's terms, header and row labels weighted above
+    body cells; tables of a kind the ask itself names (labs, schedule, eligibility) get a bonus.
+    """
+    terms = {w for w in re.findall(r"[a-z][a-z/\-]{3,}", focus.lower())} - _GENERIC
+    if not tables or not terms or n <= 0:
+        return []
+    pats = [_word_re(w) for w in terms]
+    kinds = {k for k, res in _KIND_RES.items() if any(p.search(focus) for p in res)}
+    scored = []
+    for t in tables:
+        score = _weighted_hits(_regions(t["header"], t["rows"]), pats)
+        if t["kind"] in kinds:
+            score += 10
+        if score:
+            scored.append((score, int(t["id"][1:]), t))
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    out = []
+    for _, _, t in scored[:n]:
+        text = table_tsv(t)
+        if len(text) > max_chars:
+            avg = max(1, len(text) // max(1, len(t["rows"])))
+            text = table_tsv(t, max_rows=max(1, max_chars // avg - 2))
+        out.append({"id": t["id"], "text": f"({table_label(t)})\n{text}"})
+    return out
+
+def save_tables(path: str, tables: List[dict]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(tables, f)